@@ -0,0 +1,175 @@
+"""
+KiBot Configuration Renderer
+
+Updates the `definitions` mappings of the KiBot configuration files with the
+project metadata. The files are edited line by line, so comments, ordering
+and formatting are preserved. Values are written as plain YAML scalars only
+if they are obviously strings (and, where PyYAML is installed, load back
+unchanged), everything else is double-quoted. Entries without a scalar
+value (nested blocks, block scalars, anchors, aliases, tags) are kept.
+"""
+
+import os
+import re
+import json
+from pathlib import Path
+
+try:
+    import yaml
+except ImportError:
+    # Not shipped with KiCad, the conservative plain scalar pattern is used alone
+    yaml = None
+
+
+# Start of a definitions mapping, either as key or as key of a list item
+DEFINITIONS_PATTERN = re.compile(r'^(?P<indent>[ \t]*)(?P<dash>-[ \t]+)?definitions:[ \t]*(?:#.*)?$')
+
+# Entry of a block mapping: key, separator and the rest of the line
+# (the colon must be followed by a space or end the line, "KEY:value" is a plain scalar)
+ENTRY_PATTERN = re.compile(
+    r'^(?P<indent>[ \t]*)(?P<key>[A-Za-z_][\w.-]*)(?P<sep>[ \t]*:(?:[ \t]+|$))(?P<rest>.*)$')
+
+# Values written as plain scalars: a letter first, then only harmless characters
+# (numbers, dates, sexagesimals, merge keys, ... all start with another character)
+PLAIN_SCALAR_PATTERN = re.compile(r'^[A-Za-z][\w .()/-]*$')
+
+# Words YAML 1.1 (PyYAML, used by KiBot) loads as booleans or null
+YAML11_WORDS = {'y', 'n', 'yes', 'no', 'on', 'off', 'true', 'false', 'null'}
+
+# Values that are left untouched: block scalars, flow collections, anchors, aliases and tags
+KEPT_VALUE_PREFIXES = ('|', '>', '{', '[', '&', '*', '!')
+
+KIBOT_SUFFIXES = ('.yaml', '.yml')
+
+
+def format_scalar(value):
+    """Format a value as YAML scalar (None is written as null)"""
+    if value is None:
+        return 'null'
+        
+    value = str(value)
+    plain = (PLAIN_SCALAR_PATTERN.match(value)
+             and value == value.rstrip()
+             and value.lower() not in YAML11_WORDS)
+    if plain and yaml is not None:
+        try:
+            plain = yaml.safe_load(f"value: {value}") == {'value': value}
+        except yaml.YAMLError:
+            plain = False
+    if plain:
+        return value
+        
+    # JSON strings are valid YAML double-quoted scalars
+    return json.dumps(value, ensure_ascii=False)
+
+
+def split_comment(rest):
+    """Split the rest of an entry line into value and trailing comment (with spacing)"""
+    if rest[:1] == '#':
+        return '', rest
+    if rest[:1] in ('"', "'"):
+        quote = rest[0]
+        index = 1
+        while index < len(rest):
+            char = rest[index]
+            if quote == '"' and char == '\\':
+                index += 2
+                continue
+            if char == quote:
+                if quote == "'" and rest[index + 1:index + 2] == "'":
+                    index += 2
+                    continue
+                break
+            index += 1
+        end = index + 1
+    else:
+        match = re.search(r'[ \t]#', rest)
+        end = match.start() if match else len(rest)
+        
+    value = rest[:end].rstrip()
+    return value, rest[len(value):]
+
+
+def opens_block(lines, number, indent):
+    """True if the lines after an entry without value (at line number) are its nested block"""
+    for line in lines[number + 1:]:
+        stripped = line.strip()
+        if not stripped or stripped.startswith('#'):
+            continue
+        next_indent = len(line) - len(line.lstrip())
+        # Block sequences may start at the indentation of their key
+        return next_indent > indent or (next_indent == indent and
+                                        (stripped == '-' or stripped.startswith(('- ', '-\t'))))
+    return False
+
+
+def render_definitions(content, definitions):
+    """Update all definitions mappings in the content, returns the new content"""
+    lines = content.splitlines(keepends=True)
+    block_indent = None
+    entry_indent = None
+    
+    for number, line in enumerate(lines):
+        text = line.rstrip('\r\n')
+        eol = line[len(text):]
+        
+        if block_indent is not None:
+            stripped = text.strip()
+            if not stripped or stripped.startswith('#'):
+                continue
+                
+            indent = len(text) - len(text.lstrip())
+            if indent > block_indent:
+                if entry_indent is None:
+                    entry_indent = indent
+                    
+                match = ENTRY_PATTERN.match(text)
+                # Only direct children of the mapping are definitions
+                if indent == entry_indent and match and match.group('key') in definitions:
+                    value, comment = split_comment(match.group('rest'))
+                    # An empty value either starts a nested block (kept) or is filled
+                    keep = (opens_block(lines, number, indent) if not value
+                            else value.startswith(KEPT_VALUE_PREFIXES))
+                    if not keep:
+                        sep = match.group('sep')
+                        if not sep.endswith((' ', '\t')):
+                            sep += ' '
+                        if comment and not comment[0].isspace():
+                            comment = ' ' + comment
+                        lines[number] = (f"{match.group('indent')}{match.group('key')}{sep}"
+                                         f"{format_scalar(definitions[match.group('key')])}"
+                                         f"{comment}{eol}")
+                continue
+                
+            block_indent = None
+            
+        match = DEFINITIONS_PATTERN.match(text)
+        if match:
+            block_indent = len(match.group('indent')) + len(match.group('dash') or '')
+            entry_indent = None
+            
+    return ''.join(lines)
+
+
+def update_kibot_files(kibot_dir, definitions):
+    """Update the definitions of all KiBot files in a directory, returns the changed files"""
+    changed = []
+    
+    for kibot_file in sorted(Path(kibot_dir).iterdir()):
+        if kibot_file.suffix not in KIBOT_SUFFIXES or not kibot_file.is_file():
+            continue
+            
+        with open(kibot_file, 'r', encoding='utf-8', newline='') as f:
+            content = f.read()
+            
+        rendered = render_definitions(content, definitions)
+        if rendered == content:
+            continue
+            
+        tmp_file = kibot_file.with_name(f".{kibot_file.name}.tmp")
+        with open(tmp_file, 'w', encoding='utf-8', newline='') as f:
+            f.write(rendered)
+        os.replace(tmp_file, kibot_file)
+        changed.append(kibot_file)
+        
+    return changed
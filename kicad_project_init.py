@@ -14,11 +14,214 @@ import os
 import json
 import datetime
 import shutil
-import re
 import urllib.request
 import urllib.error
 from pathlib import Path
 
+try:
+    from .project_index import (ProjectIndex, build_manifest, read_manifest,
+                                update_manifest_metadata, serialize_manifest,
+                                get_template_version, get_manifest_path,
+                                get_creation_time, MANIFEST_DIR, MANIFEST_FILE)
+except ImportError:
+    from project_index import (ProjectIndex, build_manifest, read_manifest,
+                               update_manifest_metadata, serialize_manifest,
+                               get_template_version, get_manifest_path,
+                               get_creation_time, MANIFEST_DIR, MANIFEST_FILE)
+
+try:
+    from .project_git import git_available, GitImportWriter
+except ImportError:
+    from project_git import git_available, GitImportWriter
+
+try:
+    from .template_validator import (PCB_TEMPLATE_PATTERN, validate_template,
+                                     get_errors, format_issues)
+except ImportError:
+    from template_validator import (PCB_TEMPLATE_PATTERN, validate_template,
+                                    get_errors, format_issues)
+
+try:
+    from .kibot_config import update_kibot_files, render_definitions, KIBOT_SUFFIXES
+except ImportError:
+    from kibot_config import update_kibot_files, render_definitions, KIBOT_SUFFIXES
+
+try:
+    from .project_journal import ProjectJournal
+except ImportError:
+    from project_journal import ProjectJournal
+
+try:
+    from .project_writer import DirectoryWriter, TeeWriter, open_archive_writer, zstd_available
+except ImportError:
+    from project_writer import DirectoryWriter, TeeWriter, open_archive_writer, zstd_available
+
+try:
+    from .placeholder_scan import find_markers
+    from .project_relocation import (PathResolver, relocate_paths, LIBRARY_TABLES,
+                                     URI_PATTERN, MODEL_PATTERN, RELOCATED, MISSING)
+except ImportError:
+    from placeholder_scan import find_markers
+    from project_relocation import (PathResolver, relocate_paths, LIBRARY_TABLES,
+                                    URI_PATTERN, MODEL_PATTERN, RELOCATED, MISSING)
+
+
+# Available licenses (key is the name in github.com/licenses/license-templates)
+LICENSES = [
+    {"name": "MIT", "key": "mit"},
+    {"name": "Apache 2.0", "key": "apache-2-0"},
+    {"name": "GPL 3.0", "key": "gpl-3-0"},
+    {"name": "LGPL 3.0", "key": "lgpl-3-0"},
+    {"name": "BSD 2-Clause", "key": "bsd-2-clause"},
+    {"name": "BSD 3-Clause", "key": "bsd-3-clause"},
+    {"name": "MPL 2.0", "key": "mpl-2-0"},
+    {"name": "AGPL 3.0", "key": "agpl-3-0"},
+    {"name": "Unlicense", "key": "unlicense"},
+    {"name": "CC0 1.0", "key": "cc0-1-0"},
+    {"name": "None", "key": "none"}
+]
+
+# Directories copied from the template into existing projects if missing
+TEMPLATE_EXTRA_DIRS = ['firmware', '3d-print', 'cad', '.github']
+
+# Output modes of a new project (output: 'directory', 'archive' or 'both')
+OUTPUT_MODES = [
+    {"name": "Project directory", "output": "directory", "suffix": None},
+    {"name": "Directory and .zip archive", "output": "both", "suffix": ".zip"},
+    {"name": "Directory and .tar.zst archive", "output": "both", "suffix": ".tar.zst"},
+    {"name": ".zip archive only", "output": "archive", "suffix": ".zip"},
+    {"name": ".tar.zst archive only", "output": "archive", "suffix": ".tar.zst"}
+]
+
+# Per-session cache of downloaded license templates: key -> text with placeholders
+_license_template_cache = {}
+
+# Per-session cache of .kicad_pro text variables: path -> ((mtime, size), text_variables)
+_text_variables_cache = {}
+
+
+def read_project_text_variables(kicad_pro_file):
+    """Read the text_variables of a .kicad_pro file (cached until the file changes)"""
+    try:
+        stat = os.stat(kicad_pro_file)
+    except OSError:
+        return {}
+    
+    key = str(kicad_pro_file)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _text_variables_cache.get(key)
+    if cached and cached[0] == signature:
+        return dict(cached[1])
+    
+    try:
+        with open(kicad_pro_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error reading project file: {e}")
+        return {}
+    
+    text_variables = data.get('text_variables') or {}
+    _text_variables_cache[key] = (signature, text_variables)
+    
+    return dict(text_variables)
+
+
+def scan_pcb_templates(template_path):
+    """Scan for available PCB templates"""
+    templates = []
+    hardware_path = Path(template_path) / "hardware"
+    
+    if not hardware_path.exists():
+        return templates
+        
+    for file in sorted(hardware_path.glob("Template - *.kicad_pcb")):
+        match = PCB_TEMPLATE_PATTERN.match(file.name)
+        if match:
+            templates.append({
+                'filename': file.name,
+                'manufacturer': match.group(1),
+                'thickness': match.group(2),
+                'layers': match.group(3)
+            })
+    
+    return templates
+
+
+def fetch_license_template(license_key):
+    """Download a license template from GitHub (cached for the session)"""
+    if license_key in _license_template_cache:
+        return _license_template_cache[license_key]
+    
+    url = f"https://raw.githubusercontent.com/licenses/license-templates/master/templates/{license_key}.txt"
+    with urllib.request.urlopen(url, timeout=10) as response:
+        license_text = response.read().decode('utf-8')
+    
+    _license_template_cache[license_key] = license_text
+    return license_text
+
+
+def build_text_variables(values, date=None):
+    """Build the project text variables from the dialog values"""
+    date = date or get_creation_time().date()
+    return {
+        'PROJECT_NAME': values['project_name'],
+        'BOARD_NAME': values['board_name'],
+        'DESIGNER': values['designer'],
+        'COMPANY': values['company'] if values['company'] else 'null',
+        'RELEASE_DATE': date.strftime("%d-%b-%Y"),
+        'RELEASE_DATE_NUM': date.strftime("%Y-%m-%d"),
+        'REVISION': values['revision']
+    }
+
+
+def list_template_files(template_path):
+    """Return (relative directory parts, sorted file names) of all template directories"""
+    template_path = Path(template_path)
+    listing = []
+    for directory, dir_names, file_names in os.walk(template_path, followlinks=True):
+        # .git is a directory, or a file (gitlink) if the template is a submodule
+        dir_names[:] = sorted(name for name in dir_names if name != '.git')
+        listing.append((Path(directory).relative_to(template_path).parts,
+                        sorted(name for name in file_names if name != '.git')))
+    return listing
+
+
+def is_valid_name(name):
+    """True if name can be used as a single path component (no separators, not '.' or '..')"""
+    separators = {'/', '\\', os.sep, os.altsep} - {None}
+    return bool(name) and name not in ('.', '..') and not any(sep in name for sep in separators)
+
+
+def get_archive_path(values, suffix='.zip'):
+    """Return the archive a new project is written to (None if only a directory is written)"""
+    if values.get('output', 'directory') == 'directory':
+        return None
+    if values.get('archive_path'):
+        return Path(values['archive_path'])
+    return Path(values['project_location']) / f"{values['project_name']}{suffix}"
+
+
+def render_project_file(kicad_pro_file, values):
+    """Return the content of a .kicad_pro file with updated text variables"""
+    with open(kicad_pro_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+        
+    # Ensure text_variables exists
+    if 'text_variables' not in data:
+        data['text_variables'] = {}
+        
+    data['text_variables'].update(build_text_variables(values))
+    
+    return json.dumps(data, indent=2, ensure_ascii=False)
+
+
+class ProjectCreationError(Exception):
+    """Project can not be created as requested, carries the title shown to the user"""
+    
+    def __init__(self, title, message):
+        super().__init__(message)
+        self.title = title
+
 
 class ProjectModeDialog(wx.Dialog):
     """Dialog to choose between creating new project or updating existing"""
@@ -106,7 +309,7 @@ class NewProjectDialog(wx.Dialog):
         main_sizer = wx.BoxSizer(wx.VERTICAL)
         
         # Create input fields
-        grid_sizer = wx.FlexGridSizer(9, 2, 10, 10)
+        grid_sizer = wx.FlexGridSizer(11, 2, 10, 10)
         grid_sizer.AddGrowableCol(1, 1)
         
         # Project Location
@@ -166,23 +369,30 @@ class NewProjectDialog(wx.Dialog):
         # License
         grid_sizer.Add(wx.StaticText(self, label="License:"), 
                       0, wx.ALIGN_CENTER_VERTICAL)
-        license_choices = [
-            "MIT",
-            "Apache 2.0",
-            "GPL 3.0",
-            "LGPL 3.0",
-            "BSD 2-Clause",
-            "BSD 3-Clause",
-            "MPL 2.0",
-            "AGPL 3.0",
-            "Unlicense",
-            "CC0 1.0",
-            "None"
-        ]
+        license_choices = [license_info['name'] for license_info in LICENSES]
         self.license = wx.Choice(self, choices=license_choices)
         self.license.SetSelection(0)  # Default to MIT
         grid_sizer.Add(self.license, 1, wx.EXPAND)
         
+        # Git
+        grid_sizer.Add(wx.StaticText(self, label="Git:"), 
+                      0, wx.ALIGN_CENTER_VERTICAL)
+        self.init_git = wx.CheckBox(self, label="Initialize repository with initial commit")
+        if not git_available():
+            self.init_git.SetLabel("Initialize repository (git not found)")
+            self.init_git.Disable()
+        grid_sizer.Add(self.init_git, 1, wx.EXPAND)
+        
+        # Output
+        grid_sizer.Add(wx.StaticText(self, label="Output:"), 
+                      0, wx.ALIGN_CENTER_VERTICAL)
+        # The .tar.zst modes need the optional zstandard package
+        self.output_modes = [mode for mode in OUTPUT_MODES
+                             if mode['suffix'] != '.tar.zst' or zstd_available()]
+        self.output = wx.Choice(self, choices=[mode['name'] for mode in self.output_modes])
+        self.output.SetSelection(0)  # Default to the project directory
+        grid_sizer.Add(self.output, 1, wx.EXPAND)
+        
         # Description
         grid_sizer.Add(wx.StaticText(self, label="Description:"), 
                       0, wx.ALIGN_TOP | wx.TOP, border=5)
@@ -223,26 +433,7 @@ class NewProjectDialog(wx.Dialog):
         
     def scan_pcb_templates(self):
         """Scan for available PCB templates"""
-        templates = []
-        hardware_path = self.template_path / "hardware"
-        
-        if not hardware_path.exists():
-            return templates
-            
-        # Pattern: Template - manufacturer_thickness_x-layer.kicad_pcb
-        pattern = re.compile(r'^Template - ([^_]+)_([^_]+)_(\d+)-layer\.kicad_pcb$')
-        
-        for file in hardware_path.glob("Template - *.kicad_pcb"):
-            match = pattern.match(file.name)
-            if match:
-                templates.append({
-                    'filename': file.name,
-                    'manufacturer': match.group(1),
-                    'thickness': match.group(2),
-                    'layers': match.group(3)
-                })
-        
-        return templates
+        return scan_pcb_templates(self.template_path)
         
     def get_values(self):
         """Return the entered values as a dictionary"""
@@ -253,7 +444,8 @@ class NewProjectDialog(wx.Dialog):
         license_selection = self.license.GetSelection()
         license_info = self.get_license_info(license_selection)
             
-        return {
+        output_mode = self.output_modes[max(self.output.GetSelection(), 0)]
+        values = {
             'project_location': self.project_location.GetValue(),
             'project_name': self.project_name.GetValue(),
             'board_name': self.board_name.GetValue(),
@@ -262,25 +454,21 @@ class NewProjectDialog(wx.Dialog):
             'revision': self.revision.GetValue() or "1.0.0",
             'description': self.description.GetValue(),
             'pcb_template': selected_template,
-            'license': license_info
+            'license': license_info,
+            'init_git': self.init_git.GetValue(),
+            'output': output_mode['output']
         }
+        archive_path = get_archive_path(values, output_mode['suffix'])
+        if archive_path:
+            values['archive_path'] = str(archive_path)
+            
+        return values
     
     def get_license_info(self, selection):
         """Get license information based on selection"""
-        license_map = {
-            0: {"name": "MIT", "key": "mit"},
-            1: {"name": "Apache 2.0", "key": "apache-2-0"},
-            2: {"name": "GPL 3.0", "key": "gpl-3-0"},
-            3: {"name": "LGPL 3.0", "key": "lgpl-3-0"},
-            4: {"name": "BSD 2-Clause", "key": "bsd-2-clause"},
-            5: {"name": "BSD 3-Clause", "key": "bsd-3-clause"},
-            6: {"name": "MPL 2.0", "key": "mpl-2-0"},
-            7: {"name": "AGPL 3.0", "key": "agpl-3-0"},
-            8: {"name": "Unlicense", "key": "unlicense"},
-            9: {"name": "CC0 1.0", "key": "cc0-1-0"},
-            10: {"name": "None", "key": "none"}
-        }
-        return license_map.get(selection, license_map[10])
+        if 0 <= selection < len(LICENSES):
+            return LICENSES[selection]
+        return LICENSES[-1]
     
     def validate_inputs(self):
         """Validate required inputs"""
@@ -304,6 +492,11 @@ class NewProjectDialog(wx.Dialog):
             wx.MessageBox("No PCB templates found in template directory!", "Error", 
                          wx.OK | wx.ICON_ERROR)
             return False
+        if self.init_git.GetValue() and self.output_modes[self.output.GetSelection()]['output'] == 'archive':
+            wx.MessageBox("A Git repository can only be initialized if the project directory "
+                         "is written!", "Validation Error", 
+                         wx.OK | wx.ICON_ERROR)
+            return False
         return True
 
 
@@ -395,6 +588,20 @@ class ProjectInitDialog(wx.Dialog):
             'description': self.description.GetValue()
         }
     
+    def set_values(self, values):
+        """Prefill the input fields from a dictionary (missing keys are skipped)"""
+        fields = {
+            'project_name': self.project_name,
+            'board_name': self.board_name,
+            'designer': self.designer,
+            'company': self.company,
+            'revision': self.revision,
+            'description': self.description
+        }
+        for key, control in fields.items():
+            if values.get(key):
+                control.SetValue(values[key])
+    
     def validate_inputs(self):
         """Validate required inputs"""
         if not self.project_name.GetValue():
@@ -463,6 +670,10 @@ class KiCadProjectInit(pcbnew.ActionPlugin):
             )
             return
         
+        # Check the template before anything is copied
+        if not self.validate_template(template_path):
+            return
+        
         # Show dialog
         dialog = NewProjectDialog(None, str(template_path))
         
@@ -477,10 +688,23 @@ class KiCadProjectInit(pcbnew.ActionPlugin):
             # Create the project
             success, project_path = self.copy_and_initialize_template(template_path, values)
             
-            if success:
+            if success and values['output'] == 'archive':
+                wx.MessageBox(
+                    f"Project archive created successfully!\n\n"
+                    f"Archive: {values['archive_path']}\n"
+                    f"Project: {values['project_name']}\n"
+                    f"Board: {values['board_name']}",
+                    "Success", 
+                    wx.OK | wx.ICON_INFORMATION
+                )
+            elif success:
+                archive_info = ""
+                if values.get('archive_path'):
+                    archive_info = f"Archive: {values['archive_path']}\n"
                 wx.MessageBox(
                     f"Project created successfully!\n\n"
                     f"Location: {project_path}\n"
+                    f"{archive_info}"
                     f"Project: {values['project_name']}\n"
                     f"Board: {values['board_name']}\n\n"
                     f"You can now open the project in KiCad:\n"
@@ -488,12 +712,36 @@ class KiCadProjectInit(pcbnew.ActionPlugin):
                     "Success", 
                     wx.OK | wx.ICON_INFORMATION
                 )
-            else:
-                wx.MessageBox("Failed to create project!", "Error", 
-                            wx.OK | wx.ICON_ERROR)
         else:
             dialog.Destroy()
     
+    def validate_template(self, template_path):
+        """Validate the template, shows the errors and returns False if it is broken"""
+        try:
+            issues = validate_template(template_path)
+        except Exception as e:
+            print(f"Error validating template: {e}")
+            return True
+        
+        if issues:
+            print(f"Template validation:\n{format_issues(issues)}")
+        
+        errors = get_errors(issues)
+        if errors:
+            shown = format_issues(errors[:15])
+            if len(errors) > 15:
+                shown += f"\n... and {len(errors) - 15} more"
+            wx.MessageBox(
+                f"The project template is invalid!\n\n"
+                f"Template: {template_path}\n\n"
+                f"{shown}",
+                "Template Validation Failed",
+                wx.OK | wx.ICON_ERROR
+            )
+            return False
+        
+        return True
+    
     def update_existing_project(self):
         """Update existing project metadata and copy missing template files"""
         board = pcbnew.GetBoard()
@@ -544,8 +792,14 @@ class KiCadProjectInit(pcbnew.ActionPlugin):
         # Show dialog
         dialog = ProjectInitDialog(None)
         
-        # Pre-fill board name from file
+        # Pre-fill board name from file and the rest from the project manifest
         dialog.board_name.SetValue(project_name_from_file)
+        manifest = self.load_project_manifest(project_root)
+        if manifest:
+            dialog.set_values(manifest.get('metadata', {}))
+        
+        # The project files are the source of truth if they were edited in KiCad
+        dialog.set_values(self.read_project_values(board, board_dir, project_name_from_file))
         
         if dialog.ShowModal() == wx.ID_OK:
             if not dialog.validate_inputs():
@@ -569,6 +823,10 @@ class KiCadProjectInit(pcbnew.ActionPlugin):
             copy_files = copy_msg.ShowModal() == wx.ID_YES
             copy_msg.Destroy()
             
+            # Snapshot everything that is modified, so the update can be undone
+            journal, journal_entry = self.begin_update_journal(project_root, board_dir, 
+                                                               Path(board_filename))
+            
             # Update project file (.kicad_pro)
             success = self.update_project_file(board_dir, 
                                               project_name_from_file, 
@@ -578,12 +836,29 @@ class KiCadProjectInit(pcbnew.ActionPlugin):
             
             if success:
                 # Update board metadata
-                self.update_board_metadata(board, values)
+                title_block = self.update_board_metadata(board, values)
+                
+                # Update KiBot configuration if exists
+                self.update_kibot_config(board_dir, values)
+                
+                # Keep manifest and index in sync
+                self.update_project_manifest(project_root, values)
                 
                 # Copy missing template files if requested
                 if copy_files:
+                    missing = [project_root / name 
+                               for name in TEMPLATE_EXTRA_DIRS + ['README.md', '.gitignore']
+                               if not (project_root / name).exists()]
                     copied_items = self.copy_missing_template_files(project_root, values)
+                    if journal_entry:
+                        journal.record_created(journal_entry, 
+                                               [path for path in missing if path.exists()])
                 
+                # Remember the state after the update, undo does not overwrite later changes
+                if journal_entry:
+                    sections = [(Path(board_filename), b'(title_block', title_block)] if title_block else []
+                    journal.finish(journal_entry, sections)
+                    
                 success_msg = (
                     f"Project metadata updated successfully!\n\n"
                     f"Project: {values['project_name']}\n"
@@ -596,16 +871,81 @@ class KiCadProjectInit(pcbnew.ActionPlugin):
                 if copied_items:
                     success_msg += "\n\nCopied template files:\n" + "\n".join(f"- {item}" for item in copied_items)
                 
+                if journal_entry:
+                    success_msg += (f"\n\nThe previous state was saved and can be restored with:\n"
+                                    f"python \"{Path(__file__).resolve().parent / 'project_journal.py'}\" "
+                                    f"undo \"{project_root}\"")
+                
                 wx.MessageBox(success_msg, "Success", wx.OK | wx.ICON_INFORMATION)
                 
                 # Refresh the display
                 pcbnew.Refresh()
             else:
+                # Nothing was modified, a stale entry would block the undo of older ones
+                if journal_entry:
+                    journal.discard(journal_entry)
                 wx.MessageBox("Failed to update project file!", "Error", 
                             wx.OK | wx.ICON_ERROR)
         
         dialog.Destroy()
     
+    def begin_update_journal(self, project_root, board_dir, board_file):
+        """Snapshot the files modified by a metadata update, returns (journal, entry)"""
+        try:
+            files = [board_dir / f"{board_file.stem}.kicad_pro", get_manifest_path(project_root)]
+            kibot_dir = board_dir / "kibot_yaml"
+            if kibot_dir.is_dir():
+                files += sorted(path for path in kibot_dir.iterdir() 
+                                if path.suffix in KIBOT_SUFFIXES)
+            
+            # Only the title block of the board is modified, the rest is not saved
+            sections = [(board_file, b'(title_block')]
+            
+            journal = ProjectJournal(project_root)
+            return journal, journal.begin("update_metadata", files, sections)
+            
+        except Exception as e:
+            print(f"Error creating journal entry: {e}")
+            return None, None
+    
+    def read_project_values(self, board, project_path, project_file_name):
+        """Read current metadata from the .kicad_pro text variables and the board title block"""
+        values = {}
+        
+        text_variables = read_project_text_variables(project_path / f"{project_file_name}.kicad_pro")
+        variable_map = {
+            'PROJECT_NAME': 'project_name',
+            'BOARD_NAME': 'board_name',
+            'DESIGNER': 'designer',
+            'COMPANY': 'company',
+            'REVISION': 'revision'
+        }
+        for variable, key in variable_map.items():
+            value = text_variables.get(variable)
+            # An empty company is stored as 'null'
+            if value and value != 'null':
+                values[key] = value
+        
+        try:
+            title_block = board.GetTitleBlock()
+            title_values = {
+                'board_name': title_block.GetTitle(),
+                'company': title_block.GetCompany(),
+                'revision': title_block.GetRevision()
+            }
+            for key, value in title_values.items():
+                if value and key not in values:
+                    values[key] = value
+            
+            description = title_block.GetComment(0)
+            if description:
+                values['description'] = description
+                
+        except Exception as e:
+            print(f"Error reading board title block: {e}")
+        
+        return values
+    
     def update_project_file(self, project_path, project_file_name, values):
         """Update the .kicad_pro file with text variables"""
         try:
@@ -614,27 +954,11 @@ class KiCadProjectInit(pcbnew.ActionPlugin):
             if not kicad_pro_file.exists():
                 return False
             
-            # Read the JSON file
-            with open(kicad_pro_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            # Ensure text_variables exists
-            if 'text_variables' not in data:
-                data['text_variables'] = {}
-            
-            # Update text_variables
-            current_date = datetime.date.today()
-            data['text_variables']['PROJECT_NAME'] = values['project_name']
-            data['text_variables']['BOARD_NAME'] = values['board_name']
-            data['text_variables']['DESIGNER'] = values['designer']
-            data['text_variables']['COMPANY'] = values['company'] if values['company'] else 'null'
-            data['text_variables']['RELEASE_DATE'] = current_date.strftime("%d-%b-%Y")
-            data['text_variables']['RELEASE_DATE_NUM'] = current_date.strftime("%Y-%m-%d")
-            data['text_variables']['REVISION'] = values['revision']
+            content = render_project_file(kicad_pro_file, values)
             
             # Write back to file
             with open(kicad_pro_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+                f.write(content)
             
             return True
             
@@ -643,148 +967,337 @@ class KiCadProjectInit(pcbnew.ActionPlugin):
             return False
     
     def update_board_metadata(self, board, values):
-        """Update board title and metadata"""
+        """Update board title and metadata, returns the written fields by S-expression name (None on errors)"""
         try:
             # Update title block
             title_block = board.GetTitleBlock()
-            title_block.SetTitle(values['board_name'])
+            fields = {
+                'title': values['board_name'],
+                'company': values['company'],
+                'rev': values['revision'],
+                'date': datetime.date.today().strftime("%Y-%m-%d")
+            }
+            title_block.SetTitle(fields['title'])
             
             if values['description']:
                 title_block.SetComment(0, values['description'])
+                fields['comment 1'] = values['description']
             
-            title_block.SetCompany(values['company'])
-            title_block.SetRevision(values['revision'])
-            title_block.SetDate(datetime.date.today().strftime("%Y-%m-%d"))
+            title_block.SetCompany(fields['company'])
+            title_block.SetRevision(fields['rev'])
+            title_block.SetDate(fields['date'])
             
             # Mark board as modified
             board.SetModified()
+            return fields
             
         except Exception as e:
             print(f"Error updating board metadata: {e}")
+            return None
     
-    def copy_and_initialize_template(self, template_path, values):
-        """Copy template and initialize with values"""
+    def copy_and_initialize_template(self, template_path, values, resolver=None):
+        """Copy template and initialize with values, shows the errors to the user"""
         try:
-            project_location = Path(values['project_location'])
-            project_name = values['project_name']
-            board_name = values['board_name']
+            return True, self.create_project(template_path, values, resolver)
             
-            # Create project directory
-            project_path = project_location / project_name
+        except ProjectCreationError as e:
+            wx.MessageBox(str(e), e.title, wx.OK | wx.ICON_ERROR)
+            return False, None
             
-            if project_path.exists():
-                wx.MessageBox(
-                    f"Directory already exists:\n{project_path}\n\n"
-                    f"Please choose a different name or location.",
-                    "Directory Exists", 
-                    wx.OK | wx.ICON_ERROR
-                )
-                return False, None
+        except Exception as e:
+            print(f"Error creating project: {e}")
+            import traceback
+            traceback.print_exc()
+            wx.MessageBox(f"Failed to create project!\n\n{e}", "Error", 
+                         wx.OK | wx.ICON_ERROR)
+            return False, None
             
-            # Copy template
-            shutil.copytree(template_path, project_path)
+    def create_project(self, template_path, values, resolver=None, template_files=None):
+        """
+        Create a project from the template, returns the project directory or archive.
             
-            # Rename hardware directory to board_name
-            hardware_dir = project_path / "hardware"
-            board_dir = project_path / board_name
-            if hardware_dir.exists():
-                hardware_dir.rename(board_dir)
+        Does not interact with the user (it is also run by the project service
+        on worker threads): invalid requests raise ProjectCreationError, all
+        other errors are raised unchanged. template_files is the cached result
+        of list_template_files (the template is listed if None).
+        """
+        project_location = Path(values['project_location'])
+        project_name = values['project_name']
+        output = values.get('output', 'directory')
+        
+        # Names become path components of the project and of the archive entries
+        for key, label in (('project_name', "Project Name"), ('board_name', "Board Name")):
+            if not is_valid_name(values[key]):
+                raise ProjectCreationError(
+                    "Invalid Name",
+                    f"{label} must be a plain name without '/', '\\', '.' or '..': {values[key]!r}")
+                    
+        archive_path = get_archive_path(values)
+        
+        if output == 'archive' and values.get('init_git'):
+            raise ProjectCreationError(
+                "Invalid Output",
+                "A Git repository can only be initialized if the project directory is written.")
+                
+        # Create project directory
+        project_path = project_location / project_name
+        
+        if output != 'archive' and project_path.exists():
+            raise ProjectCreationError(
+                "Directory Exists",
+                f"Directory already exists:\n{project_path}\n\n"
+                f"Please choose a different name or location.")
+                
+        if archive_path and archive_path.exists():
+            raise ProjectCreationError(
+                "Archive Exists",
+                f"Archive already exists:\n{archive_path}\n\n"
+                f"Please choose a different name or location.")
+                
+        template_version = values.get('template_version')
+        if template_version is None:
+            template_version = get_template_version(template_path)
+        manifest = build_manifest(values, template_version)
+        entries = self.plan_project_files(template_path, values, manifest, resolver, template_files)
+        
+        writers = []
+        directory_created = False
+        try:
+            # The archive writer fails early for unsupported formats, before
+            # the project directory is created
+            if archive_path:
+                writers.append(open_archive_writer(archive_path, project_name))
+            if output != 'archive':
+                writers.append(DirectoryWriter(project_path))
+                directory_created = True
+            if values.get('init_git'):
+                # The initial commit is packed while the files are written
+                writers.append(GitImportWriter(
+                    project_path,
+                    f"Initialize {values['project_name']} from template",
+                    values['designer']
+                ))
+                
+            # Every file is rendered once from the template into all outputs
+            tee = TeeWriter(writers)
+            writers = []
+            with tee as writer:
+                self.write_project_files(writer, entries)
+        except BaseException:
+            # Writers not yet handed to the tee are still open
+            for writer in writers:
+                writer.abort()
+            if directory_created and project_path.exists():
+                shutil.rmtree(project_path, ignore_errors=True)
+            if archive_path and archive_path.exists():
+                archive_path.unlink()
+            raise
             
-            # Apply PCB template
-            if values['pcb_template']:
-                self.apply_pcb_template(board_dir, values['pcb_template'], 
-                                       board_name, project_name)
+        if output == 'archive':
+            return archive_path
             
-            # Rename KiCad project files
-            self.rename_project_files(board_dir, board_name)
+        self.index_project(project_path, manifest)
+        return project_path
+    
+    def plan_project_files(self, template_path, values, manifest, resolver=None, template_files=None):
+        """
+        Plan the entries of a new project from the template.
             
-            # Update schematic title
-            self.update_schematic_title(board_dir, board_name)
+        Returns a dict of relative POSIX paths to (kind, source, data) with kind
+        'directory', 'file' (copied), 'rendered' (markers replaced, data is
+        (replacements, matches or None)) or 'bytes'.
+        """
+        template_path = Path(template_path)
+        project_name = values['project_name']
+        board_name = values['board_name']
+        template_info = values['pcb_template']
+        entries = {}
+        
+        if template_files is None:
+            template_files = list_template_files(template_path)
             
-            # Update .kicad_pro file
-            self.update_project_file(board_dir, board_name, values)
+        for relative_parts, file_names in template_files:
+            directory = template_path.joinpath(*relative_parts)
             
-            # Update kibot_main.yaml if exists
-            self.update_kibot_config(board_dir, values)
+            # Rename hardware directory to board_name
+            parts = list(relative_parts)
+            in_hardware = parts == ["hardware"]
+            if parts and parts[0] == "hardware":
+                parts[0] = board_name
+            target_dir = "/".join(parts)
+            if target_dir:
+                entries[target_dir] = ('directory', None, None)
+                
+            for name in file_names:
+                source = directory / name
+                target_name = name
+                
+                if in_hardware:
+                    # PCB templates are rendered separately, the other templates are never copied
+                    if name.startswith("Template - ") and name.endswith(".kicad_pcb"):
+                        continue
+                    if name == "Template.kicad_pcb" and template_info:
+                        continue
+                    # Rename KiCad project files (Template.* to board_name.*)
+                    if name.startswith("Template."):
+                        target_name = name.replace("Template", board_name)
+                        
+                target = f"{target_dir}/{target_name}" if target_dir else target_name
+                entries[target] = ('file', source, None)
+                
+        board_files = {path: entry for path, entry in entries.items()
+                       if path.startswith(f"{board_name}/")}
+                       
+        # Apply PCB template and update board name in one pass
+        if template_info:
+            entries[f"{board_name}/{board_name}.kicad_pcb"] = (
+                'rendered', template_path / "hardware" / template_info['filename'], ({
+                    b'BOARD_NAME" "Template"': f'BOARD_NAME" "{board_name}"'.encode('utf-8'),
+                    b'PROJECT_NAME" "Template"': f'PROJECT_NAME" "{project_name}"'.encode('utf-8')
+                }, None))
+                    
+        # Update schematic title
+        sch_file = f"{board_name}/{board_name}.kicad_sch"
+        if sch_file in board_files:
+            entries[sch_file] = ('rendered', board_files[sch_file][1], ({
+                b'(title "Template")': f'(title "{board_name}")'.encode('utf-8')
+            }, None))
+    
+        # Update .kicad_pro file
+        pro_file = f"{board_name}/{board_name}.kicad_pro"
+        if pro_file in board_files:
+            try:
+                content = render_project_file(board_files[pro_file][1], values)
+                entries[pro_file] = ('bytes', None, content.encode('utf-8'))
+            except Exception as e:
+                print(f"Error updating project file: {e}")
+    
+        # Update KiBot configuration, an empty company is written as null
+        definitions = build_text_variables(values)
+        definitions['COMPANY'] = values['company'] or None
+        for path, (kind, source, _) in board_files.items():
+            if (kind == 'file' and path.startswith(f"{board_name}/kibot_yaml/")
+                    and path.count('/') == 2 and source.suffix in KIBOT_SUFFIXES):
+                with open(source, 'r', encoding='utf-8', newline='') as f:
+                    content = render_definitions(f.read(), definitions)
+                entries[path] = ('bytes', None, content.encode('utf-8'))
+                
+        # Point library tables and 3D models to locations valid for the new project
+        self.relocate_project_paths(entries, template_path, board_name, resolver or PathResolver())
+        
+        # Create license files if selected
+        if values['license']['key'] != 'none':
+            license_text = self.create_license_text(values)
+            if license_text:
+                data = license_text.encode('utf-8')
+                entries["LICENSE"] = ('bytes', None, data)
+                for subdir in [board_name, 'firmware', '3d-print', 'cad']:
+                    if entries.get(subdir, (None,))[0] == 'directory':
+                        entries[f"{subdir}/LICENSE"] = ('bytes', None, data)
+                        
+        # Record how the project was created
+        entries[MANIFEST_DIR] = ('directory', None, None)
+        entries[f"{MANIFEST_DIR}/{MANIFEST_FILE}"] = ('bytes', None, serialize_manifest(manifest))
+        
+        return entries
+        
+    def relocate_project_paths(self, entries, template_path, board_name, resolver):
+        """Rewrite library table and 3D model paths of the planned board files"""
+        template_hardware_dir = Path(template_path) / "hardware"
+        relocated = []
+        missing = []
+        
+        targets = [(f"{board_name}/{name}", URI_PATTERN) for name in LIBRARY_TABLES]
+        targets.append((f"{board_name}/{board_name}.kicad_pcb", MODEL_PATTERN))
+        
+        for path, pattern in targets:
+            if path not in entries or entries[path][0] not in ('file', 'rendered'):
+                continue
+            kind, source, data = entries[path]
             
-            # Create license files if selected
-            if values['license']['key'] != 'none':
-                self.create_license_files(project_path, board_dir, values)
+            try:
+                matches, replacements, results = relocate_paths(
+                    source, pattern, template_path, template_hardware_dir, resolver)
+            except Exception as e:
+                print(f"Error relocating paths in {path}: {e}")
+                continue
+                
+            relocated.extend(reference for reference, (result, _) in results.items()
+                             if result == RELOCATED)
+            missing.extend(reference for reference, (result, _) in results.items()
+                           if result == MISSING)
+            if not matches:
+                continue
+                
+            # Relocated paths are replaced in the same pass as the placeholders
+            if kind == 'rendered':
+                marker_replacements = data[0]
+                matches = sorted(matches + find_markers(source, marker_replacements.keys()))
+                replacements = {**marker_replacements, **replacements}
+            entries[path] = ('rendered', source, (replacements, matches))
             
-            return True, project_path
+        if relocated:
+            print(f"Relocated {len(relocated)} library/model path(s)")
+        for reference in sorted(set(missing)):
+            print(f"Library/model not found: {reference}")
             
-        except Exception as e:
-            print(f"Error creating project: {e}")
-            import traceback
-            traceback.print_exc()
-            return False, None
+    def write_project_files(self, writer, entries):
+        """Write the planned entries in a deterministic order (parents first)"""
+        for path in sorted(entries, key=lambda path: path.split('/')):
+            kind, source, data = entries[path]
+            if kind == 'directory':
+                writer.add_directory(path)
+            elif kind == 'file':
+                writer.add_file(path, source)
+            elif kind == 'rendered':
+                writer.add_rendered(path, source, *data)
+            else:
+                writer.add_bytes(path, data)
     
-    def apply_pcb_template(self, board_dir, template_info, board_name, project_name):
-        """Apply selected PCB template"""
+    def update_kibot_config(self, board_dir, values):
+        """Update the definitions of all KiBot configuration files"""
         try:
-            source_pcb = board_dir / template_info['filename']
-            target_pcb = board_dir / "Template.kicad_pcb"
+            kibot_dir = board_dir / "kibot_yaml"
+            if not kibot_dir.is_dir():
+                return
+            
+            # Same values as the project text variables, an empty company is written as null
+            definitions = build_text_variables(values)
+            definitions['COMPANY'] = values['company'] or None
+            
+            update_kibot_files(kibot_dir, definitions)
             
-            if source_pcb.exists():
-                # Copy selected template
-                shutil.copy2(source_pcb, target_pcb)
-                
-                # Update board name in PCB file
-                content = target_pcb.read_text(encoding='utf-8')
-                content = content.replace('BOARD_NAME" "Template"', f'BOARD_NAME" "{board_name}"')
-                content = content.replace('PROJECT_NAME" "Template"', f'PROJECT_NAME" "{project_name}"')
-                target_pcb.write_text(content, encoding='utf-8')
-                
-                # Remove all other template files
-                for template_file in board_dir.glob("Template - *.kicad_pcb"):
-                    template_file.unlink()
-                    
         except Exception as e:
-            print(f"Error applying PCB template: {e}")
+            print(f"Error updating kibot config: {e}")
     
-    def rename_project_files(self, board_dir, board_name):
-        """Rename Template.* files to board_name.*"""
+    def index_project(self, project_path, manifest):
+        """Add a created project to the project index"""
         try:
-            for template_file in board_dir.glob("Template.*"):
-                new_name = board_dir / template_file.name.replace("Template", board_name)
-                template_file.rename(new_name)
+            with ProjectIndex() as index:
+                index.add(project_path, manifest)
+                
         except Exception as e:
-            print(f"Error renaming project files: {e}")
+            print(f"Error updating project index: {e}")
     
-    def update_schematic_title(self, board_dir, board_name):
-        """Update title in main schematic file"""
+    def load_project_manifest(self, project_root):
+        """Load the project manifest (from the index if it is up to date)"""
         try:
-            sch_file = board_dir / f"{board_name}.kicad_sch"
-            if sch_file.exists():
-                content = sch_file.read_text(encoding='utf-8')
-                content = re.sub(r'\(title "Template"\)', f'(title "{board_name}")', content)
-                sch_file.write_text(content, encoding='utf-8')
+            with ProjectIndex() as index:
+                return index.lookup(project_root)
         except Exception as e:
-            print(f"Error updating schematic title: {e}")
+            print(f"Error reading project index: {e}")
+            return read_manifest(project_root)
     
-    def update_kibot_config(self, board_dir, values):
-        """Update kibot_main.yaml configuration"""
+    def update_project_manifest(self, project_root, values):
+        """Update the metadata in the project manifest and the index"""
         try:
-            kibot_file = board_dir / "kibot_yaml" / "kibot_main.yaml"
-            if not kibot_file.exists():
-                return
-                
-            content = kibot_file.read_text(encoding='utf-8')
-            
-            # Update definitions
-            content = re.sub(r'PROJECT_NAME: Project', 
-                           f'PROJECT_NAME: {values["project_name"]}', content)
-            content = re.sub(r'BOARD_NAME: Board', 
-                           f'BOARD_NAME: {values["board_name"]}', content)
-            content = re.sub(r'COMPANY: Kampis-Elektroecke', 
-                           f'COMPANY: {values["company"] or "null"}', content)
-            content = re.sub(r'DESIGNER: Daniel Kampert', 
-                           f'DESIGNER: {values["designer"]}', content)
-            
-            kibot_file.write_text(content, encoding='utf-8')
+            manifest = update_manifest_metadata(project_root, values)
             
+            with ProjectIndex() as index:
+                index.add(project_root, manifest)
+                
         except Exception as e:
-            print(f"Error updating kibot config: {e}")
+            print(f"Error updating project manifest: {e}")
     
     def copy_missing_template_files(self, project_root, values):
         """Copy missing directories and files from template to existing project"""
@@ -798,9 +1311,7 @@ class KiCadProjectInit(pcbnew.ActionPlugin):
             copied_items = []
             
             # Directories to copy if missing
-            dirs_to_copy = ['firmware', '3d-print', 'cad', '.github']
-            
-            for dir_name in dirs_to_copy:
+            for dir_name in TEMPLATE_EXTRA_DIRS:
                 src_dir = template_path / dir_name
                 dst_dir = project_root / dir_name
                 
@@ -845,46 +1356,27 @@ class KiCadProjectInit(pcbnew.ActionPlugin):
             traceback.print_exc()
             return [f"Error: {str(e)}"]
     
-    def create_license_files(self, project_root, board_dir, values):
-        """Create license files in project and subdirectories"""
+    def create_license_text(self, values):
+        """Return the license text of the selected license (None if it can not be created)"""
         try:
-            license_key = values['license']['key']
-            license_name = values['license']['name']
-            designer = values['designer']
-            year = datetime.date.today().year
-            
-            # Try to download license from GitHub
-            license_text = self.download_license(license_key, year, designer)
-            
+            license_text = self.download_license(values['license']['key'], 
+                                                 get_creation_time().year, 
+                                                 values['designer'])
             if license_text:
-                # Create license in project root
-                license_file = project_root / "LICENSE"
-                license_file.write_text(license_text, encoding='utf-8')
-                
-                # Create license in subdirectories
-                subdirs = [board_dir, project_root / 'firmware', 
-                          project_root / '3d-print', project_root / 'cad']
-                
-                for subdir in subdirs:
-                    if subdir.exists():
-                        sub_license = subdir / "LICENSE"
-                        sub_license.write_text(license_text, encoding='utf-8')
-                        
-                print(f"License files created: {license_name}")
+                print(f"License files created: {values['license']['name']}")
             else:
-                print(f"Could not create license files for: {license_name}")
+                print(f"Could not create license files for: {values['license']['name']}")
+            return license_text
                 
         except Exception as e:
             print(f"Error creating license files: {e}")
+            return None
     
     def download_license(self, license_key, year, copyright_holder):
         """Download license template from GitHub"""
         try:
-            url = f"https://raw.githubusercontent.com/licenses/license-templates/master/templates/{license_key}.txt"
-            
             # Download license
-            with urllib.request.urlopen(url, timeout=10) as response:
-                license_text = response.read().decode('utf-8')
+            license_text = fetch_license_template(license_key)
             
             # Replace placeholders
             license_text = license_text.replace('[year]', str(year))
@@ -894,7 +1386,7 @@ class KiCadProjectInit(pcbnew.ActionPlugin):
             return license_text
             
         except (urllib.error.URLError, urllib.error.HTTPError) as e:
-            print(f"Failed to download license from {url}: {e}")
+            print(f"Failed to download license {license_key}: {e}")
             # Create placeholder license
             return self.create_placeholder_license(license_key, year, copyright_holder)
         except Exception as e:
@@ -0,0 +1,179 @@
+"""
+Placeholder Scanner
+
+Finds the placeholders replaced during project creation in (possibly very
+large) board and schematic files. Files are memory-mapped and searched as
+bytes for all markers in one pass, without decoding them into a str. The
+offsets of the matches are fed to a streaming rewriter, so peak memory stays
+flat independent of the file size and unchanged files are never rewritten.
+"""
+
+import os
+import re
+import mmap
+import shutil
+import tempfile
+from pathlib import Path
+
+
+# Chunk size used to copy the unchanged parts of a file
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Maximum number of scan results kept in the match cache
+MATCH_CACHE_SIZE = 256
+
+# Strings (which may contain parentheses) and parentheses of an S-expression
+SEXPR_TOKEN_PATTERN = re.compile(rb'"(?:[^"\\]|\\.)*"|[()]', re.DOTALL)
+
+# Scan results of unchanged files: (path, mtime, size, pattern) -> matches
+_match_cache = {}
+
+
+class StaleMatchError(ValueError):
+    """The file changed since its markers were scanned"""
+
+
+def compile_markers(markers):
+    """Compile a pattern matching any of the markers (longest first, in a stable order)"""
+    ordered = sorted(set(markers), key=lambda marker: (-len(marker), marker))
+    return re.compile(b'|'.join(re.escape(marker) for marker in ordered))
+
+
+def find_markers(file_path, markers):
+    """
+    Return a list of (offset, marker) for all markers found in the file.
+
+    Results are cached until the file changes, so template files that are
+    rendered repeatedly (e.g. by the project service) are only scanned once.
+    """
+    return find_pattern(file_path, compile_markers(markers))
+
+
+def find_pattern(file_path, pattern):
+    """
+    Return a list of (offset, match) for all matches of a compiled bytes pattern.
+
+    Results are cached by file (path, mtime, size) and pattern.
+    """
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size, pattern.pattern)
+    if key in _match_cache:
+        return _match_cache[key]
+        
+    matches = []
+    if stat.st_size:
+        with open(file_path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                matches = [(match.start(), match.group()) for match in pattern.finditer(mapped)]
+                
+    if len(_match_cache) >= MATCH_CACHE_SIZE:
+        _match_cache.clear()
+    _match_cache[key] = matches
+    
+    return matches
+
+
+def forget_matches(file_path):
+    """Drop all cached scan results of a file"""
+    path = os.path.abspath(file_path)
+    for key in [key for key in list(_match_cache) if key[0] == path]:
+        _match_cache.pop(key, None)
+
+
+def verify_matches(mapped, matches):
+    """True if every marker is still found at its offset"""
+    return all(mapped[offset:offset + len(marker)] == marker for offset, marker in matches)
+
+
+def check_matches(source, matches):
+    """True if every marker is still found at its offset in the file"""
+    with open(source, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return not matches
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return verify_matches(mapped, matches)
+
+
+def rendered_size(source, matches, replacements):
+    """Size of the source after replacing the markers at the given offsets"""
+    return os.path.getsize(source) + sum(len(replacements[marker]) - len(marker)
+                                         for _, marker in matches)
+
+
+def stream_markers(source, matches, replacements, out):
+    """
+    Write source to the stream out, replacing the markers at the given offsets.
+
+    All offsets are verified before anything is written: the cached matches
+    of a file that changed without a new mtime or size are dropped and
+    StaleMatchError is raised.
+    """
+    with open(source, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            if matches:
+                forget_matches(source)
+                raise StaleMatchError(f"{source} changed since it was scanned")
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if not verify_matches(mapped, matches):
+                forget_matches(source)
+                raise StaleMatchError(f"{source} changed since it was scanned")
+            position = 0
+            for offset, marker in matches:
+                for start in range(position, offset, COPY_CHUNK_SIZE):
+                    out.write(mapped[start:min(start + COPY_CHUNK_SIZE, offset)])
+                out.write(replacements[marker])
+                position = offset + len(marker)
+            for start in range(position, size, COPY_CHUNK_SIZE):
+                out.write(mapped[start:start + COPY_CHUNK_SIZE])
+
+
+def rewrite_markers(source, target, matches, replacements):
+    """Stream source to target, replacing the markers at the given offsets"""
+    source = Path(source)
+    target = Path(target)
+    
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{target.name}.", dir=str(target.parent))
+    try:
+        with open(fd, 'wb') as out:
+            stream_markers(source, matches, replacements, out)
+                    
+        shutil.copymode(source, tmp_name)
+        # The source must be closed and unmapped before it can be replaced on Windows
+        os.replace(tmp_name, target)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+
+def find_sexpr_block(file_path, marker):
+    """
+    Return (offset, block) of the first S-expression starting with marker, or None.
+
+    marker must include the opening parenthesis, e.g. b'(title_block'.
+    """
+    matches = find_markers(file_path, [marker])
+    if matches and not check_matches(file_path, matches[:1]):
+        # Changed within the timestamp resolution, scan again
+        forget_matches(file_path)
+        matches = find_markers(file_path, [marker])
+    if not matches:
+        return None
+        
+    start = matches[0][0]
+    depth = 0
+    with open(file_path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if not verify_matches(mapped, matches[:1]):
+                forget_matches(file_path)
+                raise StaleMatchError(f"{file_path} changed since it was scanned")
+            for token in SEXPR_TOKEN_PATTERN.finditer(mapped, start):
+                if token.group() == b'(':
+                    depth += 1
+                elif token.group() == b')':
+                    depth -= 1
+                    if depth == 0:
+                        return start, mapped[start:token.end()]
+                        
+    return None
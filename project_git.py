@@ -0,0 +1,224 @@
+"""
+Git Repository Initialization
+
+Initializes a Git repository for a newly created project and writes the
+initial commit with a single git fast-import stream. The repository is a
+writer next to the project directory: every file is packed and hashed while
+it is written, instead of `git init && git add -A` reading the tree back into
+loose objects and the index. The index is written from these object IDs with
+the real stat data of the files, so the first `git status` does not hash the
+work tree again.
+"""
+
+import os
+import time
+import struct
+import shutil
+import hashlib
+import subprocess
+from pathlib import Path
+
+try:
+    from .project_writer import ProjectWriter, EntryStream
+except ImportError:
+    from project_writer import ProjectWriter, EntryStream
+
+
+# Version 2 of the index file format (documented in gitformat-index)
+INDEX_SIGNATURE = b'DIRC'
+INDEX_VERSION = 2
+INDEX_NAME_MASK = 0xFFF
+
+
+def git_available():
+    """Check if the git executable can be found"""
+    return shutil.which('git') is not None
+
+
+def run_git(repo_path, *args):
+    """Run a git command in the repository and return its stdout"""
+    result = subprocess.run(
+        ['git', *args], cwd=str(repo_path), capture_output=True, check=True,
+        creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+    )
+    return result.stdout
+
+
+def get_ident(repo_path, fallback_name):
+    """Return the committer identity ('Name <email> time tz') for fast-import"""
+    try:
+        ident = run_git(repo_path, 'var', 'GIT_COMMITTER_IDENT').decode('utf-8').strip()
+        if ident:
+            return ident
+    except (OSError, subprocess.CalledProcessError):
+        pass
+        
+    # No identity configured, fall back to the designer of the project
+    offset = time.localtime().tm_gmtoff // 60
+    sign = '+' if offset >= 0 else '-'
+    offset = abs(offset)
+    return f"{fallback_name} <> {int(time.time())} {sign}{offset // 60:02d}{offset % 60:02d}"
+
+
+def quote_path(path):
+    """C-style quote a path for the fast-import stream"""
+    escaped = (path.replace('\\', '\\\\').replace('"', '\\"')
+               .replace('\n', '\\n').replace('\t', '\\t'))
+    return f'"{escaped}"'
+
+
+def get_object_format(repo_path):
+    """Return the hash algorithm of the repository ('sha1' or 'sha256')"""
+    try:
+        object_format = run_git(repo_path, 'rev-parse', '--show-object-format').decode('utf-8').strip()
+    except subprocess.CalledProcessError:
+        # Git before 2.25 only knows SHA-1
+        return 'sha1'
+    return object_format or 'sha1'
+
+
+def write_index(git_dir, entries, object_format):
+    """
+    Write the index for (name, mode, object_id, stat) entries.
+
+    The stat data is the one of the work tree files, so git treats them as
+    clean without hashing their content.
+    """
+    entries = sorted(entries, key=lambda entry: entry[0].encode('utf-8'))
+    data = bytearray(struct.pack('>4sII', INDEX_SIGNATURE, INDEX_VERSION, len(entries)))
+    
+    for name, mode, object_id, file_stat in entries:
+        encoded = name.encode('utf-8')
+        fields = (file_stat.st_ctime_ns // 1000000000, file_stat.st_ctime_ns % 1000000000,
+                  file_stat.st_mtime_ns // 1000000000, file_stat.st_mtime_ns % 1000000000,
+                  file_stat.st_dev, file_stat.st_ino, int(mode, 8),
+                  file_stat.st_uid, file_stat.st_gid, file_stat.st_size)
+        entry = bytearray(struct.pack('>10I', *(value & 0xFFFFFFFF for value in fields)))
+        entry += object_id
+        entry += struct.pack('>H', min(len(encoded), INDEX_NAME_MASK))
+        entry += encoded
+        # Entries are NUL terminated and padded to a multiple of 8 bytes
+        entry += b'\0' * (8 - len(entry) % 8)
+        data += entry
+        
+    data += hashlib.new(object_format, data).digest()
+    
+    lock_file = Path(git_dir) / "index.lock"
+    with open(lock_file, 'xb') as f:
+        f.write(data)
+    os.replace(lock_file, Path(git_dir) / "index")
+
+
+class BlobStream(EntryStream):
+    """Entry stream that hashes the blob while it is sent to fast-import"""
+    
+    def __init__(self, writer, size, object_id, on_close):
+        super().__init__(writer, size, on_close)
+        self.object_id = object_id
+        
+    def write(self, data):
+        self.object_id.update(data)
+        return super().write(data)
+
+
+class GitImportWriter(ProjectWriter):
+    """
+    Commits the project while it is written into the work tree.
+    
+    Every file is streamed into git fast-import and hashed on the way, the
+    commit and the index are written from these object IDs at close. Files
+    ignored by .gitignore are left out of the commit, their blobs are already
+    sent and stay unreachable until the next gc.
+    """
+    
+    def __init__(self, repo_path, message, fallback_name):
+        self.repo_path = Path(repo_path)
+        self.message = message
+        self.entries = []
+        self.broken = False
+    
+        try:
+            run_git(self.repo_path, 'init', '-q')
+            self.branch = run_git(self.repo_path, 'symbolic-ref', 'HEAD').decode('utf-8').strip()
+            self.git_dir = self.repo_path / run_git(self.repo_path, 'rev-parse', '--git-dir').decode('utf-8').strip()
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(f"git init failed: {e.stderr.decode('utf-8', errors='replace').strip()}")
+        self.ident = get_ident(self.repo_path, fallback_name)
+        self.object_format = get_object_format(self.repo_path)
+            
+        self.process = subprocess.Popen(
+            ['git', 'fast-import', '--quiet', '--done'], cwd=str(self.repo_path),
+            stdin=subprocess.PIPE, stderr=subprocess.PIPE,
+            creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+        )
+                
+    def write(self, data):
+        """Send data to fast-import, a failure is reported by close"""
+        if not self.broken:
+            try:
+                self.process.stdin.write(data)
+            except BrokenPipeError:
+                self.broken = True
+            
+    def add_directory(self, relative_path):
+        # Git only tracks files
+        pass
+        
+    def open_entry(self, relative_path, size, mode=0o644):
+        mark = len(self.entries) + 1
+        git_mode = '100755' if mode & 0o111 else '100644'
+        self.write(b'blob\nmark :%d\ndata %d\n' % (mark, size))
+        object_id = hashlib.new(self.object_format, b'blob %d\0' % size)
+        
+        def finish_blob(entry):
+            self.write(b'\n')
+            self.entries.append((relative_path, git_mode, mark, object_id.digest()))
+    
+        return BlobStream(self, size, object_id, finish_blob)
+        
+    def ignored_paths(self, names):
+        """Return the names that are ignored by .gitignore or the exclude files"""
+        result = subprocess.run(
+            ['git', 'check-ignore', '-z', '--stdin'], cwd=str(self.repo_path),
+            input='\0'.join(names).encode('utf-8'), capture_output=True,
+            creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+        )
+        # Exit code 1 means that no path is ignored
+        if result.returncode not in (0, 1):
+            raise RuntimeError(f"git check-ignore failed: "
+                               f"{result.stderr.decode('utf-8', errors='replace').strip()}")
+        return {name for name in result.stdout.decode('utf-8').split('\0') if name}
+        
+    def close(self):
+        ignored = self.ignored_paths([name for name, _, _, _ in self.entries]) if self.entries else set()
+        entries = [entry for entry in self.entries if entry[0] not in ignored]
+        
+        message_data = self.message.encode('utf-8')
+        self.write(f"commit {self.branch}\n"
+                   f"author {self.ident}\n"
+                   f"committer {self.ident}\n".encode('utf-8'))
+        self.write(b'data %d\n' % len(message_data))
+        self.write(message_data + b'\n')
+        for name, mode, mark, _ in entries:
+            self.write(f"M {mode} :{mark} {quote_path(name)}\n".encode('utf-8'))
+        self.write(b'\ndone\n')
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+            
+        errors = self.process.stderr.read().decode('utf-8', errors='replace')
+        self.process.stderr.close()
+        if self.process.wait() != 0:
+            raise RuntimeError(f"git fast-import failed: {errors.strip()}")
+            
+        # The files are complete in the work tree, only their stat data is read
+        write_index(self.git_dir, [(name, mode, object_id, os.lstat(self.repo_path / name))
+                                   for name, mode, _, object_id in entries], self.object_format)
+                                   
+    def abort(self):
+        # Nothing is committed from an incomplete project
+        self.process.kill()
+        self.process.stdin.close()
+        self.process.stderr.close()
+        self.process.wait()
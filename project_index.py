@@ -0,0 +1,437 @@
+"""
+Project Manifest and Index
+
+Every project created by the plugin gets a small machine-readable manifest
+(.project_init/manifest.json) recording the template version, PCB variant,
+license and metadata it was created with. Manifests from all known project
+roots are aggregated in a local SQLite index, so dialogs can be prefilled and
+projects can be queried without crawling the disks.
+
+Usage (outside of KiCad):
+    python project_index.py scan D:\\Projects E:\\Archive
+    python project_index.py query --manufacturer jlcpcb --layers 4 --template-version v3
+    python project_index.py show D:\\Projects\\MyProject
+"""
+
+import os
+import json
+import sqlite3
+import datetime
+import subprocess
+from pathlib import Path
+
+
+PLUGIN_VERSION = "1.0.0"
+MANIFEST_VERSION = 1
+MANIFEST_DIR = ".project_init"
+MANIFEST_FILE = "manifest.json"
+
+# Directories never descended into while scanning for manifests
+SCAN_SKIP_DIRS = {'.git', '.svn', '.hg', 'node_modules', '__pycache__', 'venv', '.venv'}
+
+
+def get_data_dir():
+    """Return the per-user directory for plugin caches and indexes"""
+    override = os.environ.get('KICAD_PROJECT_INIT_DATA')
+    if override:
+        return Path(override)
+        
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or (Path.home() / "AppData" / "Local")
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or (Path.home() / ".cache")
+        
+    return Path(base) / "kicad_project_init"
+
+
+def get_manifest_path(project_root):
+    """Return the manifest path of a project"""
+    return Path(project_root) / MANIFEST_DIR / MANIFEST_FILE
+
+
+def get_creation_time():
+    """Current time, or SOURCE_DATE_EPOCH (UTC) if set for reproducible output"""
+    try:
+        epoch = int(os.environ['SOURCE_DATE_EPOCH'])
+    except (KeyError, ValueError):
+        return datetime.datetime.now()
+    return datetime.datetime.fromtimestamp(epoch, datetime.timezone.utc).replace(tzinfo=None)
+
+
+def get_template_version(template_path):
+    """Return the version of the template (git describe of the submodule)"""
+    try:
+        # A template without its own repository would get the version of an
+        # enclosing repository (e.g. the plugin checkout)
+        result = subprocess.run(
+            ['git', '-C', str(template_path), 'rev-parse', '--show-toplevel'],
+            capture_output=True, text=True, timeout=5,
+            creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+        )
+        toplevel = result.stdout.strip()
+        if result.returncode != 0 or not toplevel:
+            return "unknown"
+        if Path(toplevel).resolve() != Path(template_path).resolve():
+            return "unknown"
+            
+        result = subprocess.run(
+            ['git', '-C', str(template_path), 'describe', '--tags', '--always', '--dirty'],
+            capture_output=True, text=True, timeout=5,
+            creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+        )
+        if result.returncode == 0 and result.stdout.strip():
+            return result.stdout.strip()
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"Could not determine template version: {e}")
+        
+    return "unknown"
+
+
+def build_manifest(values, template_version=None):
+    """Build a manifest dictionary from the dialog values"""
+    now = get_creation_time().isoformat(timespec='seconds')
+    
+    template_info = values.get('pcb_template')
+    template = {
+        'version': template_version,
+        'pcb_variant': None,
+        'manufacturer': None,
+        'thickness': None,
+        'layers': None
+    }
+    if template_info:
+        template.update({
+            'pcb_variant': template_info['filename'],
+            'manufacturer': template_info['manufacturer'],
+            'thickness': template_info['thickness'],
+            'layers': int(template_info['layers'])
+        })
+        
+    license_info = values.get('license') or {"name": "None", "key": "none"}
+    
+    return {
+        'manifest_version': MANIFEST_VERSION,
+        'plugin_version': PLUGIN_VERSION,
+        'created': now,
+        'updated': now,
+        'template': template,
+        'license': {'key': license_info['key'], 'name': license_info['name']},
+        'metadata': {
+            'project_name': values.get('project_name', ''),
+            'board_name': values.get('board_name', ''),
+            'designer': values.get('designer', ''),
+            'company': values.get('company', ''),
+            'revision': values.get('revision', ''),
+            'description': values.get('description', '')
+        }
+    }
+
+
+def read_manifest(project_root):
+    """Read the manifest of a project, returns None if missing or unreadable"""
+    manifest_file = get_manifest_path(project_root)
+    try:
+        with open(manifest_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Error reading manifest {manifest_file}: {e}")
+        return None
+
+
+def serialize_manifest(manifest):
+    """Return the manifest as written to the manifest file (bytes)"""
+    return (json.dumps(manifest, indent=2, ensure_ascii=False) + '\n').encode('utf-8')
+
+
+def write_manifest(project_root, manifest):
+    """Write the manifest of a project atomically"""
+    manifest_file = get_manifest_path(project_root)
+    manifest_file.parent.mkdir(parents=True, exist_ok=True)
+    
+    tmp_file = manifest_file.with_suffix('.tmp')
+    with open(tmp_file, 'wb') as f:
+        f.write(serialize_manifest(manifest))
+    os.replace(tmp_file, manifest_file)
+    
+    return manifest_file
+
+
+def update_manifest_metadata(project_root, values):
+    """Update the metadata section of a project manifest (creates one if missing)"""
+    manifest = read_manifest(project_root)
+    if manifest is None:
+        # Project was not created by the plugin, the template is unknown
+        manifest = build_manifest(values)
+        
+    manifest['updated'] = get_creation_time().isoformat(timespec='seconds')
+    manifest.setdefault('metadata', {}).update({
+        'project_name': values['project_name'],
+        'board_name': values['board_name'],
+        'designer': values['designer'],
+        'company': values['company'],
+        'revision': values['revision'],
+        'description': values['description']
+    })
+    write_manifest(project_root, manifest)
+    
+    return manifest
+
+
+class ProjectIndex:
+    """SQLite index aggregating the manifests of all known projects"""
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS projects (
+            path TEXT PRIMARY KEY,
+            manifest_mtime INTEGER NOT NULL,
+            project_name TEXT,
+            board_name TEXT,
+            designer TEXT,
+            company TEXT,
+            revision TEXT,
+            manufacturer TEXT COLLATE NOCASE,
+            thickness TEXT,
+            layers INTEGER,
+            license TEXT,
+            template_version TEXT,
+            created TEXT,
+            updated TEXT,
+            manifest TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_projects_variant
+            ON projects (layers, manufacturer, template_version);
+        CREATE INDEX IF NOT EXISTS idx_projects_template
+            ON projects (template_version);
+    """
+    
+    def __init__(self, db_path=None):
+        self.db_path = Path(db_path) if db_path else get_data_dir() / "projects.sqlite"
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        self.conn = sqlite3.connect(str(self.db_path))
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(self.SCHEMA)
+        
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        
+    def close(self):
+        """Close the database connection"""
+        self.conn.close()
+        
+    @staticmethod
+    def _key(project_root):
+        """Normalized index key of a project root"""
+        return str(Path(project_root).resolve())
+        
+    def add(self, project_root, manifest=None):
+        """Add or refresh a project in the index"""
+        manifest_file = get_manifest_path(project_root)
+        if manifest is None:
+            manifest = read_manifest(project_root)
+            if manifest is None:
+                return False
+                
+        try:
+            mtime = manifest_file.stat().st_mtime_ns
+        except OSError:
+            mtime = 0
+            
+        template = manifest.get('template') or {}
+        metadata = manifest.get('metadata') or {}
+        license_info = manifest.get('license') or {}
+        
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO projects VALUES "
+                "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (self._key(project_root), mtime,
+                 metadata.get('project_name'), metadata.get('board_name'),
+                 metadata.get('designer'), metadata.get('company'),
+                 metadata.get('revision'),
+                 template.get('manufacturer'), template.get('thickness'),
+                 template.get('layers'), license_info.get('key'),
+                 template.get('version'),
+                 manifest.get('created'), manifest.get('updated'),
+                 json.dumps(manifest, ensure_ascii=False))
+            )
+        return True
+        
+    def remove(self, project_root):
+        """Remove a project from the index"""
+        with self.conn:
+            self.conn.execute("DELETE FROM projects WHERE path = ?",
+                              (self._key(project_root),))
+                              
+    def lookup(self, project_root):
+        """Return the manifest of a project, refreshing the entry if the file changed"""
+        key = self._key(project_root)
+        row = self.conn.execute(
+            "SELECT manifest_mtime, manifest FROM projects WHERE path = ?", (key,)
+        ).fetchone()
+        
+        try:
+            mtime = get_manifest_path(project_root).stat().st_mtime_ns
+        except OSError:
+            if row:
+                self.remove(project_root)
+            return None
+            
+        if row and row['manifest_mtime'] == mtime:
+            return json.loads(row['manifest'])
+            
+        manifest = read_manifest(project_root)
+        if manifest is not None:
+            self.add(project_root, manifest)
+        return manifest
+        
+    def scan(self, roots, max_depth=4):
+        """Index all projects below the given roots, returns (updated, removed)"""
+        updated = 0
+        removed = 0
+        
+        for root in roots:
+            root_key = self._key(root)
+            # Prefix match with substr(), LIKE would treat _ and % in the path as wildcards
+            prefix = os.path.join(root_key, '')
+            known = {
+                row['path']: row['manifest_mtime']
+                for row in self.conn.execute(
+                    "SELECT path, manifest_mtime FROM projects "
+                    "WHERE path = ? OR substr(path, 1, ?) = ?",
+                    (root_key, len(prefix), prefix)
+                )
+            }
+            
+            for project_root, mtime in self._find_manifests(Path(root_key), max_depth):
+                key = str(project_root)
+                if known.pop(key, None) == mtime:
+                    continue
+                if self.add(project_root):
+                    updated += 1
+                    
+            # Whatever is left has lost its manifest
+            with self.conn:
+                for key in known:
+                    self.conn.execute("DELETE FROM projects WHERE path = ?", (key,))
+            removed += len(known)
+            
+        return updated, removed
+        
+    def _find_manifests(self, root, max_depth):
+        """Yield (project_root, manifest_mtime) for all manifests below root"""
+        pending = [(root, 0)]
+        while pending:
+            directory, depth = pending.pop()
+            
+            try:
+                mtime = get_manifest_path(directory).stat().st_mtime_ns
+            except OSError:
+                mtime = None
+                
+            if mtime is not None:
+                # Projects are not nested, no need to descend further
+                yield directory, mtime
+                continue
+                
+            if depth >= max_depth:
+                continue
+                
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if (entry.is_dir(follow_symlinks=False)
+                                and entry.name not in SCAN_SKIP_DIRS):
+                            pending.append((Path(entry.path), depth + 1))
+            except OSError as e:
+                print(f"Error scanning {directory}: {e}")
+                
+    def query(self, manufacturer=None, layers=None, template_version=None,
+              license_key=None, designer=None):
+        """Return all indexed projects matching the given filters"""
+        clauses = []
+        params = []
+        
+        if manufacturer:
+            clauses.append("manufacturer = ?")
+            params.append(manufacturer)
+        if layers:
+            clauses.append("layers = ?")
+            params.append(int(layers))
+        if template_version:
+            # "v3" matches v3, v3.1.0, v3-4-gabcdef, ...
+            clauses.append("(template_version = ? OR substr(template_version, 1, ?) IN (?, ?))")
+            params.extend([template_version, len(template_version) + 1,
+                           f"{template_version}.", f"{template_version}-"])
+        if license_key:
+            clauses.append("license = ?")
+            params.append(license_key)
+        if designer:
+            clauses.append("designer = ?")
+            params.append(designer)
+            
+        sql = "SELECT * FROM projects"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY project_name, board_name"
+        
+        return [dict(row) for row in self.conn.execute(sql, params)]
+
+
+def main(argv=None):
+    """Command line interface for the project index"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="KiCad project manifest index")
+    parser.add_argument('--db', help="Path of the index database")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    scan_parser = subparsers.add_parser('scan', help="Index all projects below the given roots")
+    scan_parser.add_argument('roots', nargs='+')
+    scan_parser.add_argument('--max-depth', type=int, default=4)
+    
+    query_parser = subparsers.add_parser('query', help="Query indexed projects")
+    query_parser.add_argument('--manufacturer')
+    query_parser.add_argument('--layers', type=int)
+    query_parser.add_argument('--template-version')
+    query_parser.add_argument('--license', dest='license_key')
+    query_parser.add_argument('--designer')
+    query_parser.add_argument('--json', action='store_true', help="Print full manifests as JSON")
+    
+    show_parser = subparsers.add_parser('show', help="Show the manifest of a project")
+    show_parser.add_argument('project')
+    
+    args = parser.parse_args(argv)
+    
+    with ProjectIndex(args.db) as index:
+        if args.command == 'scan':
+            updated, removed = index.scan(args.roots, args.max_depth)
+            print(f"Indexed {updated} project(s), removed {removed} stale entries")
+        elif args.command == 'query':
+            rows = index.query(args.manufacturer, args.layers, args.template_version,
+                               args.license_key, args.designer)
+            if args.json:
+                print(json.dumps([json.loads(row['manifest']) for row in rows], indent=2))
+            else:
+                for row in rows:
+                    print(f"{row['path']}: {row['project_name']} / {row['board_name']} "
+                          f"({row['manufacturer']} {row['thickness']} {row['layers']}-layer, "
+                          f"template {row['template_version']}, license {row['license']})")
+                print(f"{len(rows)} project(s)")
+        elif args.command == 'show':
+            manifest = index.lookup(args.project)
+            if manifest is None:
+                print(f"No manifest found for {args.project}")
+                return 1
+            print(json.dumps(manifest, indent=2, ensure_ascii=False))
+            
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,394 @@
+"""
+Project Journal
+
+Snapshots the files of a project right before they are modified and records
+the operation in a journal (.project_init/journal/), so metadata updates can
+be undone with a single command. Only the affected files are saved: as
+reflink (copy-on-write clone, where the file system supports it) or gzip
+compressed. Large board files are not copied at all, only the S-expression
+sections that are modified (e.g. the title block) are stored.
+
+Files and sections changed again after the operation are not overwritten by
+an undo (unless forced), and operations can only be undone newest first.
+
+Usage (outside of KiCad):
+    python project_journal.py list D:\\Projects\\MyProject
+    python project_journal.py undo D:\\Projects\\MyProject [--entry ID] [--force]
+"""
+
+import os
+import re
+import sys
+import gzip
+import errno
+import json
+import shutil
+import datetime
+from pathlib import Path
+
+try:
+    from .project_index import MANIFEST_DIR
+    from .placeholder_scan import find_sexpr_block, rewrite_markers
+except ImportError:
+    from project_index import MANIFEST_DIR
+    from placeholder_scan import find_sexpr_block, rewrite_markers
+
+
+JOURNAL_DIR = "journal"
+ENTRY_FILE = "entry.json"
+
+# ioctl request of Linux to clone a file (reflink)
+FICLONE = 0x40049409
+
+
+def sexpr_field(block, name):
+    """Return the string value of a field like (rev "1.0") in an S-expression block ('' if missing)"""
+    name_pattern = rb'\s+'.join(re.escape(part.encode('utf-8')) for part in name.split())
+    match = re.search(rb'\(' + name_pattern + rb'\s+"((?:[^"\\]|\\.)*)"\s*\)', block)
+    if match is None:
+        return ''
+    return re.sub(rb'\\(.)', rb'\1', match.group(1)).decode('utf-8', 'surrogateescape')
+
+
+def reflink_supported():
+    """True if reflink_file is implemented on this platform (the file system may still lack support)"""
+    return sys.platform.startswith('linux') or sys.platform == 'darwin'
+
+
+def reflink_file(source, target):
+    """
+    Clone a file with copy-on-write (raises OSError if not supported).
+
+    Uses FICLONE on Linux (Btrfs, XFS, ...) and clonefile on macOS (APFS),
+    block cloning of ReFS on Windows is not implemented.
+    """
+    if sys.platform == 'darwin':
+        import ctypes
+        
+        # clonefile does not replace existing files
+        if os.path.lexists(target):
+            os.unlink(target)
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(source), os.fsencode(target), 0) != 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), str(target))
+        return
+        
+    if not reflink_supported():
+        raise OSError(errno.EOPNOTSUPP, "reflink is not supported on this platform")
+    import fcntl
+        
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.unlink(target)
+            raise
+
+
+def snapshot_file(source, target):
+    """Save a copy of a file, returns the method used ('reflink' or 'gzip')"""
+    try:
+        reflink_file(source, target)
+        return 'reflink'
+    except OSError:
+        pass
+        
+    with open(source, 'rb') as src, gzip.open(f"{target}.gz", 'wb', compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst)
+    return 'gzip'
+
+
+def restore_file(snapshot, method, target, mtime=None):
+    """Restore a file from its snapshot (with its original modification time, if given)"""
+    target = Path(target)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = target.with_name(f".{target.name}.undo")
+    
+    if method == 'reflink':
+        try:
+            reflink_file(snapshot, tmp_file)
+        except OSError:
+            shutil.copyfile(snapshot, tmp_file)
+    else:
+        with gzip.open(f"{snapshot}.gz", 'rb') as src, open(tmp_file, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+            
+    # Undoing the previous entry then finds the state it recorded after its operation
+    if mtime is not None:
+        os.utime(tmp_file, ns=(mtime, mtime))
+    os.replace(tmp_file, target)
+
+
+class ProjectJournal:
+    """Journal of the modifications of a project"""
+    
+    def __init__(self, project_root):
+        self.project_root = Path(project_root)
+        self.journal_dir = self.project_root / MANIFEST_DIR / JOURNAL_DIR
+        
+    def begin(self, operation, files=(), sections=()):
+        """
+        Snapshot files and S-expression sections before an operation, returns the entry.
+
+        files are paths that will be modified (or created), sections are
+        (path, marker) tuples of S-expressions within large files that will
+        be modified, e.g. (board_file, b'(title_block').
+        """
+        now = datetime.datetime.now()
+        entry_id = f"{now.strftime('%Y%m%d-%H%M%S-%f')}-{operation}"
+        entry_dir = self.journal_dir / entry_id
+        entry_dir.mkdir(parents=True)
+        self.ignore_journal()
+        
+        entry = {
+            'id': entry_id,
+            'operation': operation,
+            'created': now.isoformat(timespec='seconds'),
+            'undone': False,
+            'files': [],
+            'sections': [],
+            'created_files': []
+        }
+        
+        for number, file_path in enumerate(files):
+            file_path = Path(file_path)
+            record = {'path': self.relative(file_path), 'existed': file_path.is_file()}
+            if record['existed']:
+                record['snapshot'] = f"file{number}"
+                record['snapshot_mtime'] = file_path.stat().st_mtime_ns
+                record['method'] = snapshot_file(file_path, entry_dir / record['snapshot'])
+            entry['files'].append(record)
+            
+        for number, (file_path, marker) in enumerate(sections):
+            file_path = Path(file_path)
+            block = find_sexpr_block(file_path, marker) if file_path.is_file() else None
+            if block is None:
+                continue
+            snapshot = f"section{number}.gz"
+            with gzip.open(entry_dir / snapshot, 'wb') as f:
+                f.write(block[1])
+            entry['sections'].append({
+                'path': self.relative(file_path),
+                'marker': marker.decode('utf-8'),
+                'snapshot': snapshot
+            })
+            
+        self.save(entry)
+        return entry
+        
+    def record_created(self, entry, paths):
+        """Record files and directories created by the operation (removed on undo)"""
+        for path in paths:
+            path = Path(path)
+            candidates = [path] if path.is_file() else [p for p in path.rglob('*') if p.is_file()]
+            for file_path in candidates:
+                stat = file_path.stat()
+                entry['created_files'].append({
+                    'path': self.relative(file_path),
+                    'size': stat.st_size,
+                    'mtime': stat.st_mtime_ns
+                })
+        self.save(entry)
+        
+    def finish(self, entry, sections=()):
+        """
+        Record the state after the operation (checked on undo).
+
+        sections are (path, marker, fields) tuples with the values the
+        operation wrote into a section, e.g. {'rev': "2.0"} (KiCad omits
+        empty fields, they are compared as '').
+        """
+        for file_path, marker, fields in sections:
+            for record in entry['sections']:
+                if (record['path'] == self.relative(file_path)
+                        and record['marker'] == marker.decode('utf-8')):
+                    record['fields'] = fields
+                    
+        for record in entry['files']:
+            try:
+                stat = (self.project_root / record['path']).stat()
+            except OSError:
+                record['size'] = record['mtime'] = None
+                continue
+            record['size'] = stat.st_size
+            record['mtime'] = stat.st_mtime_ns
+        self.save(entry)
+        
+    def discard(self, entry):
+        """Remove an entry of an operation that did not modify anything"""
+        shutil.rmtree(self.journal_dir / entry['id'], ignore_errors=True)
+        
+    def is_unchanged(self, record):
+        """True if a file still has the state recorded by finish"""
+        if 'size' not in record:
+            return False
+        try:
+            stat = (self.project_root / record['path']).stat()
+        except OSError:
+            return record['size'] is None
+        return stat.st_size == record['size'] and stat.st_mtime_ns == record['mtime']
+        
+    def is_section_unchanged(self, record, block):
+        """True if a section still carries the field values recorded by finish"""
+        if 'fields' not in record:
+            return False
+        return all(sexpr_field(block, name) == value for name, value in record['fields'].items())
+        
+    def relative(self, path):
+        """Path relative to the project root (as stored in the journal)"""
+        return Path(os.path.relpath(path, self.project_root)).as_posix()
+        
+    def ignore_journal(self):
+        """Keep the journal out of version control"""
+        gitignore = self.journal_dir.parent / ".gitignore"
+        if not gitignore.exists():
+            gitignore.write_text(f"{JOURNAL_DIR}/\n", encoding='utf-8')
+            
+    def save(self, entry):
+        """Write a journal entry"""
+        entry_file = self.journal_dir / entry['id'] / ENTRY_FILE
+        with open(entry_file, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, indent=2, ensure_ascii=False)
+            
+    def list_entries(self):
+        """Return all journal entries, oldest first"""
+        entries = []
+        if not self.journal_dir.is_dir():
+            return entries
+            
+        for entry_dir in sorted(self.journal_dir.iterdir()):
+            try:
+                with open(entry_dir / ENTRY_FILE, 'r', encoding='utf-8') as f:
+                    entries.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return entries
+        
+    def undo(self, entry_id=None, force=False):
+        """
+        Undo an operation (default: the last one not undone), returns the entry and messages.
+
+        Files modified since the operation are skipped unless force is set,
+        the entry then stays open so it can be undone again with force.
+        Entries can only be undone newest first.
+        """
+        entries = [entry for entry in self.list_entries() if not entry['undone']]
+        if not entries:
+            return None, ["Nothing to undo"]
+        entry_ids = [entry['id'] for entry in entries]
+        if entry_id and entry_id not in entry_ids:
+            return None, [f"No entry to undo: {entry_id}"]
+        if entry_id and entry_ids[-1] != entry_id:
+            newer = entry_ids[entry_ids.index(entry_id) + 1:]
+            return None, [f"Undo the newer entries first: {', '.join(newer)}"]
+            
+        entry = entries[-1]
+        entry_dir = self.journal_dir / entry['id']
+        messages = []
+        skipped = False
+        
+        for record in entry['files']:
+            target = self.project_root / record['path']
+            if not force and not self.is_unchanged(record):
+                messages.append(f"Skipped {record['path']} (modified since the operation, use --force)")
+                skipped = True
+                continue
+            if record['existed']:
+                restore_file(entry_dir / record['snapshot'], record['method'], target,
+                             record.get('snapshot_mtime'))
+                messages.append(f"Restored {record['path']}")
+            elif target.exists():
+                target.unlink()
+                messages.append(f"Removed {record['path']}")
+                
+        for record in entry['sections']:
+            target = self.project_root / record['path']
+            current = find_sexpr_block(target, record['marker'].encode('utf-8')) if target.exists() else None
+            if current is None:
+                messages.append(f"Skipped {record['path']}: {record['marker']} not found")
+                continue
+            with gzip.open(entry_dir / record['snapshot'], 'rb') as f:
+                original = f.read()
+            offset, block = current
+            if block != original and not force and not self.is_section_unchanged(record, block):
+                messages.append(f"Skipped {record['marker']} in {record['path']} "
+                                f"(modified since the operation, use --force)")
+                skipped = True
+                continue
+            if block != original:
+                rewrite_markers(target, target, [(offset, block)], {block: original})
+            messages.append(f"Restored {record['marker']} in {record['path']}")
+            
+        # Created files are only removed if they were not modified since
+        created_dirs = set()
+        for record in entry['created_files']:
+            target = self.project_root / record['path']
+            try:
+                stat = target.stat()
+            except OSError:
+                continue
+            if stat.st_size != record['size'] or stat.st_mtime_ns != record['mtime']:
+                messages.append(f"Kept {record['path']} (modified)")
+                continue
+            target.unlink()
+            created_dirs.update(parent for parent in target.parents
+                                if self.project_root in parent.parents)
+            messages.append(f"Removed {record['path']}")
+            
+        for directory in sorted(created_dirs, key=lambda d: len(d.parts), reverse=True):
+            try:
+                directory.rmdir()
+            except OSError:
+                pass
+                
+        if skipped:
+            messages.append(f"{entry['id']} is not undone completely, "
+                            f"run again with --force to restore the skipped files")
+            return None, messages
+            
+        entry['undone'] = True
+        entry['undone_at'] = datetime.datetime.now().isoformat(timespec='seconds')
+        self.save(entry)
+        
+        return entry, messages
+
+
+def main(argv=None):
+    """Command line interface for the project journal"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Undo journal of KiCad project updates")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    list_parser = subparsers.add_parser('list', help="List the journal entries of a project")
+    list_parser.add_argument('project')
+    
+    undo_parser = subparsers.add_parser('undo', help="Undo the last (or the given) operation")
+    undo_parser.add_argument('project')
+    undo_parser.add_argument('--entry', help="ID of the entry to undo (only the newest one)")
+    undo_parser.add_argument('--force', action='store_true',
+                             help="Also restore files that were modified since the operation")
+    
+    args = parser.parse_args(argv)
+    journal = ProjectJournal(args.project)
+    
+    if args.command == 'list':
+        for entry in journal.list_entries():
+            state = " (undone)" if entry['undone'] else ""
+            print(f"{entry['id']}: {entry['operation']}, {len(entry['files'])} file(s), "
+                  f"{len(entry['sections'])} section(s), "
+                  f"{len(entry['created_files'])} created file(s){state}")
+    elif args.command == 'undo':
+        entry, messages = journal.undo(args.entry, args.force)
+        print("\n".join(messages))
+        if entry is None:
+            return 1
+        print(f"Undone: {entry['id']}")
+        
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
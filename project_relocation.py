@@ -0,0 +1,233 @@
+"""
+Path Relocation
+
+Rewrites the library tables (fp-lib-table, sym-lib-table) and the 3D model
+paths of the board when a project is created from a template, so the new
+project does not reference locations that only exist on the machine of the
+template author:
+
+- ${KIPRJMOD} (and plain relative) paths into the template stay unchanged,
+  the referenced files are copied with the project. Paths leaving the
+  template are rewritten to the absolute location they resolve to.
+- Absolute paths into the template are rewritten to ${KIPRJMOD}, absolute
+  paths that do not exist on this machine are looked up in the template
+  (longest matching path suffix) and rewritten to ${KIPRJMOD} as well.
+- Paths using other variables (e.g. ${KICAD7_3DMODEL_DIR}) are resolved by
+  KiCad and left untouched.
+
+All references are resolved once per batch by a shared PathResolver: each
+path is checked for existence only once and the checks run concurrently.
+"""
+
+import os
+import re
+import time
+import threading
+import concurrent.futures
+from pathlib import Path, PureWindowsPath
+
+try:
+    from .placeholder_scan import find_pattern
+except ImportError:
+    from placeholder_scan import find_pattern
+
+
+LIBRARY_TABLES = ('fp-lib-table', 'sym-lib-table')
+
+# Quoted or (in old files) unquoted S-expression path values
+SEXPR_VALUE = rb'(?:"(?P<quoted>(?:[^"\\]|\\.)*)"|(?P<plain>[^\s()"]+))'
+
+# Library URI of a library table entry
+URI_PATTERN = re.compile(rb'\(uri\s+' + SEXPR_VALUE, re.DOTALL)
+
+# 3D model of a footprint in a board file
+MODEL_PATTERN = re.compile(rb'\(model\s+' + SEXPR_VALUE, re.DOTALL)
+
+PROJECT_VARIABLE = "${KIPRJMOD}"
+VARIABLE_PATTERN = re.compile(r'\$\{[^}]*\}|\$\([^)]*\)')
+
+# Results of a reference
+KEEP = 'keep'
+RELOCATED = 'relocated'
+MISSING = 'missing'
+EXTERNAL = 'external'
+
+
+def decode_sexpr_value(match):
+    """Return the path of a URI/model match as str"""
+    quoted = match.group('quoted')
+    if quoted is None:
+        return match.group('plain').decode('utf-8', 'surrogateescape')
+    value = re.sub(rb'\\(.)', rb'\1', quoted, flags=re.DOTALL)
+    return value.decode('utf-8', 'surrogateescape')
+
+
+def encode_sexpr_value(path):
+    """Return a path as quoted S-expression string"""
+    value = path.replace('\\', '\\\\').replace('"', '\\"')
+    return b'"' + value.encode('utf-8', 'surrogateescape') + b'"'
+
+
+def is_absolute_path(path):
+    """True for absolute POSIX and Windows paths (independent of the platform)"""
+    return path.startswith(('/', '\\')) or PureWindowsPath(path).is_absolute()
+
+
+def path_parts(path):
+    """Split a POSIX or Windows path into its components (without drive/root)"""
+    parts = [part for part in re.split(r'[\\/]+', path) if part]
+    if parts and PureWindowsPath(path).drive:
+        parts = parts[1:]
+    return parts
+
+
+def is_within(path, root):
+    """True if path is root or inside of it (both normalized)"""
+    return path == root or path.startswith(root.rstrip(os.sep) + os.sep)
+
+
+class PathResolver:
+    """
+    Resolves library and model references of a template.
+
+    Results and existence checks are cached (for max_age seconds), a single
+    resolver should be shared by all projects created in a batch.
+    """
+    
+    def __init__(self, workers=8, max_age=300.0):
+        self.workers = workers
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.exists_cache = {}
+        self.result_cache = {}
+        
+    def clear(self):
+        """Drop all cached results (e.g. when the template changed)"""
+        with self.lock:
+            self.exists_cache.clear()
+            self.result_cache.clear()
+            
+    def check_paths(self, paths):
+        """Check the existence of paths concurrently, returns path -> bool"""
+        now = time.monotonic()
+        with self.lock:
+            known = {path: cached[1] for path, cached in
+                     ((path, self.exists_cache.get(path)) for path in paths)
+                     if cached and now - cached[0] < self.max_age}
+        unknown = sorted(set(paths) - known.keys())
+        
+        if len(unknown) > 1:
+            with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=min(self.workers, len(unknown))) as executor:
+                results = dict(zip(unknown, executor.map(os.path.exists, unknown)))
+        else:
+            results = {path: os.path.exists(path) for path in unknown}
+            
+        with self.lock:
+            for path, exists in results.items():
+                self.exists_cache[path] = (now, exists)
+                
+        known.update(results)
+        return known
+        
+    def candidates(self, template_root, project_dir, reference):
+        """
+        Return (kind, paths) of the locations a reference may point to.
+
+        kind is 'project' (relative to the template project directory),
+        'absolute' (the path itself, then suffixes within the template) or
+        EXTERNAL (resolved by KiCad).
+        """
+        path = reference
+        if path.startswith(PROJECT_VARIABLE):
+            path = path[len(PROJECT_VARIABLE):].lstrip('/\\')
+        if VARIABLE_PATTERN.search(path):
+            return EXTERNAL, []
+            
+        if not is_absolute_path(path):
+            parts = path_parts(path)
+            return 'project', [os.path.normpath(os.path.join(project_dir, *parts))]
+            
+        parts = path_parts(path)
+        paths = [path]
+        # Longest suffix first, e.g. D:\KiCad\__Project__\hardware\3d\x.step -> hardware/3d/x.step
+        paths.extend(os.path.join(template_root, *parts[start:]) for start in range(len(parts)))
+        return 'absolute', paths
+        
+    def resolve(self, template_root, project_dir, references):
+        """
+        Resolve references of the template project in project_dir (within template_root).
+
+        Returns a dict reference -> (result, new reference) with result KEEP,
+        RELOCATED, MISSING or EXTERNAL (new reference is None unless RELOCATED).
+        """
+        template_root = os.path.normpath(str(template_root))
+        project_dir = os.path.normpath(str(project_dir))
+        now = time.monotonic()
+        
+        resolved = {}
+        pending = {}
+        with self.lock:
+            for reference in set(references):
+                cached = self.result_cache.get((template_root, project_dir, reference))
+                if cached and now - cached[0] < self.max_age:
+                    resolved[reference] = cached[1]
+                    
+        for reference in set(references) - resolved.keys():
+            pending[reference] = self.candidates(template_root, project_dir, reference)
+            
+        exists = self.check_paths([path for _, paths in pending.values() for path in paths])
+        
+        for reference, (kind, paths) in pending.items():
+            if kind == EXTERNAL:
+                result = (EXTERNAL, None)
+            elif kind == 'project':
+                target = paths[0]
+                if is_within(target, template_root):
+                    # Copied with the project, the relative path stays valid
+                    result = (KEEP if exists[target] else MISSING, None)
+                elif exists[target]:
+                    result = (RELOCATED, Path(target).as_posix())
+                else:
+                    result = (MISSING, None)
+            elif exists[paths[0]] and not is_within(os.path.normpath(paths[0]), template_root):
+                result = (KEEP, None)
+            else:
+                # An existing path into the template would point to the template, not the copy
+                found = paths[0] if exists[paths[0]] else next(
+                    (path for path in paths[1:] if exists[path]), None)
+                if found:
+                    relative = Path(os.path.relpath(found, project_dir)).as_posix()
+                    result = (RELOCATED, f"{PROJECT_VARIABLE}/{relative}")
+                else:
+                    result = (MISSING, None)
+                    
+            resolved[reference] = result
+            with self.lock:
+                self.result_cache[(template_root, project_dir, reference)] = (now, result)
+                
+        return resolved
+
+
+def relocate_paths(file_path, pattern, template_root, project_dir, resolver):
+    """
+    Resolve all path references of a file.
+
+    Returns (matches, replacements, results) for the streaming rewriter:
+    matches are (offset, token) of the relocated references only, results
+    maps every reference to its result.
+    """
+    tokens = find_pattern(file_path, pattern)
+    references = {token: decode_sexpr_value(pattern.match(token)) for _, token in tokens}
+    results = resolver.resolve(template_root, project_dir, references.values())
+    
+    replacements = {}
+    for token, reference in references.items():
+        result, new_reference = results[reference]
+        if result == RELOCATED:
+            match = pattern.match(token)
+            start = match.start('quoted') - 1 if match.group('quoted') is not None else match.start('plain')
+            replacements[token] = token[:start] + encode_sexpr_value(new_reference)
+            
+    matches = [(offset, token) for offset, token in tokens if token in replacements]
+    return matches, replacements, results
@@ -0,0 +1,517 @@
+"""
+Project Creation Service
+
+Long-running local service that creates projects on demand. The template
+catalog (PCB templates, validation result, template version), the
+placeholder offsets of the rendered template files and the license texts are
+kept warm in memory, so a request only pays for the actual file writes.
+Template roots are polled for changes and only the changed files are
+re-validated and re-scanned. Library and 3D model paths of a template are
+resolved once and shared by all projects created from it. Creation requests are queued onto a worker pool.
+
+The service has to be started with the Python interpreter shipped with KiCad
+(pcbnew and wx must be importable):
+    python project_service.py --template default=D:\\KiCad\\__Project__ --port 8765
+
+JSON API (no authentication, binds to localhost by default; POST requests
+must be sent as application/json and are rejected if the Origin header names
+a foreign web page):
+    GET  /health            Service status
+    GET  /templates         Template catalog
+    POST /projects          Queue a project creation, returns the job
+    GET  /jobs/<id>         Job status
+
+POST /projects body:
+    {"project_location": "...", "project_name": "...", "board_name": "...",
+     "designer": "...", "company": "", "revision": "1.0.0", "description": "",
+     "pcb_template": "jlcpcb_1.6mm_4-layer", "license": "mit",
+     "init_git": false, "template": "default", "wait": false,
+     "output": "directory", "archive_path": null}
+
+output is "directory", "archive" or "both". The archive format is chosen by
+the suffix of archive_path (.zip, .tar, .tar.gz, .tar.xz or .tar.zst), the
+default is <project_location>/<project_name>.zip.
+"""
+
+import os
+import json
+import uuid
+import time
+import threading
+import http.server
+import urllib.parse
+import concurrent.futures
+from pathlib import Path
+
+try:
+    from .kicad_project_init import (KiCadProjectInit, LICENSES, scan_pcb_templates,
+                                     list_template_files, fetch_license_template, get_archive_path,
+                                     is_valid_name)
+    from .project_index import get_template_version
+    from .template_validator import (validate_files, check_structure, merge_issues, get_errors,
+                                     ERROR, PCB_PLACEHOLDERS, SCHEMATIC_PLACEHOLDERS)
+    from .placeholder_scan import find_markers
+    from .project_relocation import PathResolver
+    from .project_writer import zstd_available
+except ImportError:
+    from kicad_project_init import (KiCadProjectInit, LICENSES, scan_pcb_templates,
+                                    list_template_files, fetch_license_template, get_archive_path,
+                                    is_valid_name)
+    from project_index import get_template_version
+    from template_validator import (validate_files, check_structure, merge_issues, get_errors,
+                                    ERROR, PCB_PLACEHOLDERS, SCHEMATIC_PLACEHOLDERS)
+    from placeholder_scan import find_markers
+    from project_relocation import PathResolver
+    from project_writer import zstd_available
+
+
+# Number of finished jobs kept for status queries
+MAX_FINISHED_JOBS = 1000
+
+# Fields of a creation request: name -> (type, name of the type), all may be null
+REQUEST_FIELDS = {
+    'project_location': (str, "string"),
+    'project_name': (str, "string"),
+    'board_name': (str, "string"),
+    'designer': (str, "string"),
+    'company': (str, "string"),
+    'revision': (str, "string"),
+    'description': (str, "string"),
+    'pcb_template': (str, "string"),
+    'license': (str, "string"),
+    'init_git': (bool, "boolean"),
+    'template': (str, "string"),
+    'wait': (bool, "boolean"),
+    'output': (str, "string"),
+    'archive_path': (str, "string")
+}
+
+# Hosts a browser may send requests from (besides the address the service is bound to)
+LOCAL_HOSTS = ('localhost', '127.0.0.1', '::1')
+
+
+class ServiceError(Exception):
+    """Invalid request, carries the HTTP status code"""
+    
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def check_request(request):
+    """Check the types of the fields of a creation request"""
+    if not isinstance(request, dict):
+        raise ServiceError(400, "Request must be a JSON object")
+    for key, (expected, type_name) in REQUEST_FIELDS.items():
+        value = request.get(key)
+        if value is not None and not isinstance(value, expected):
+            raise ServiceError(400, f"'{key}' must be a {type_name}")
+
+
+class TemplateCatalog:
+    """Warm state of a single template root"""
+    
+    def __init__(self, name, template_path):
+        self.name = name
+        self.template_path = Path(template_path).resolve()
+        self.lock = threading.Lock()
+        
+        self.file_stats = {}
+        self.template_files = []
+        self.pcb_templates = []
+        self.file_issues = {}
+        self.issues = []
+        self.template_version = None
+        
+        # Library and model paths are resolved once for all projects of this template
+        self.resolver = PathResolver()
+        
+        self.reload(self.snapshot())
+        
+    def snapshot(self):
+        """Return (mtime, size) of all template files"""
+        stats = {}
+        for directory, dirnames, filenames in os.walk(self.template_path):
+            dirnames[:] = [d for d in dirnames if d != '.git']
+            for filename in filenames:
+                file_path = Path(directory) / filename
+                try:
+                    stat = file_path.stat()
+                except OSError:
+                    continue
+                stats[file_path.relative_to(self.template_path).as_posix()] = (
+                    stat.st_mtime_ns, stat.st_size)
+        return stats
+        
+    def reload(self, file_stats, changed=None):
+        """Reload the catalog, only the changed files are scanned again"""
+        pcb_templates = scan_pcb_templates(self.template_path)
+        
+        # Listing used to plan every project, so requests do not walk the template
+        template_files = list_template_files(self.template_path)
+        
+        # Only the changed files are validated again, issues of removed files are dropped
+        if changed is None:
+            file_issues = validate_files(self.template_path)
+        else:
+            file_issues = {path: issues_of_file for path, issues_of_file in self.file_issues.items()
+                           if path in file_stats and path not in changed}
+            file_issues.update(validate_files(self.template_path, sorted(changed & file_stats.keys())))
+        issues = merge_issues(check_structure(self.template_path), file_issues)
+        template_version = get_template_version(self.template_path)
+        
+        # Warm the placeholder offsets used when rendering the project
+        hardware_path = self.template_path / "hardware"
+        rendered = [(f"hardware/{template['filename']}", PCB_PLACEHOLDERS)
+                    for template in pcb_templates]
+        rendered.append(("hardware/Template.kicad_sch", SCHEMATIC_PLACEHOLDERS))
+        for relative_path, markers in rendered:
+            if changed is not None and relative_path not in changed:
+                continue
+            file_path = hardware_path / Path(relative_path).name
+            if file_path.exists():
+                find_markers(file_path, markers)
+                
+        with self.lock:
+            self.file_stats = file_stats
+            self.template_files = template_files
+            self.pcb_templates = pcb_templates
+            self.file_issues = file_issues
+            self.issues = issues
+            self.template_version = template_version
+            
+    def check_for_changes(self):
+        """Reload the catalog if template files changed, returns the changed files"""
+        file_stats = self.snapshot()
+        old_stats = self.file_stats
+        
+        changed = {path for path in file_stats.keys() | old_stats.keys()
+                   if file_stats.get(path) != old_stats.get(path)}
+        if changed:
+            self.resolver.clear()
+            self.reload(file_stats, changed)
+        return changed
+        
+    def find_pcb_template(self, name):
+        """Find a PCB template by file name or 'manufacturer_thickness_x-layer'"""
+        with self.lock:
+            for template in self.pcb_templates:
+                variant = f"{template['manufacturer']}_{template['thickness']}_{template['layers']}-layer"
+                if name in (template['filename'], variant):
+                    return template
+        return None
+        
+    def to_dict(self):
+        """Return the catalog as JSON serializable dictionary"""
+        with self.lock:
+            return {
+                'name': self.name,
+                'path': str(self.template_path),
+                'version': self.template_version,
+                'pcb_templates': self.pcb_templates,
+                'issues': [{'severity': severity, 'path': path, 'message': message}
+                           for severity, path, message in self.issues]
+            }
+
+
+class ProjectService:
+    """Queues project creations onto a worker pool using warm template catalogs"""
+    
+    def __init__(self, catalogs, workers=4, poll_interval=5.0):
+        self.catalogs = {catalog.name: catalog for catalog in catalogs}
+        self.default_catalog = catalogs[0].name
+        self.poll_interval = poll_interval
+        
+        self.plugin = KiCadProjectInit()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        
+        self.jobs = {}
+        self.futures = {}
+        self.active_paths = set()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        
+    def start(self):
+        """Start the template watcher and warm the license texts"""
+        threading.Thread(target=self.watch_templates, daemon=True).start()
+        self.executor.submit(self.warm_licenses)
+        
+    def stop(self):
+        """Stop the watcher and wait for queued jobs"""
+        self.stop_event.set()
+        self.executor.shutdown(wait=True)
+        
+    def warm_licenses(self):
+        """Download all license templates once"""
+        for license_info in LICENSES:
+            if license_info['key'] == 'none':
+                continue
+            try:
+                fetch_license_template(license_info['key'])
+            except Exception as e:
+                print(f"Could not download license {license_info['key']}: {e}")
+                
+    def watch_templates(self):
+        """Poll the template roots and reload changed catalogs"""
+        while not self.stop_event.wait(self.poll_interval):
+            for catalog in self.catalogs.values():
+                try:
+                    changed = catalog.check_for_changes()
+                    if changed:
+                        print(f"Template {catalog.name} reloaded ({len(changed)} file(s) changed)")
+                except Exception as e:
+                    print(f"Error reloading template {catalog.name}: {e}")
+                    
+    def build_values(self, request, catalog):
+        """Convert a creation request into the values used by the plugin"""
+        for key in ('project_location', 'project_name', 'board_name', 'designer', 'pcb_template'):
+            if not request.get(key):
+                raise ServiceError(400, f"'{key}' is required")
+        for key in ('project_name', 'board_name'):
+            if not is_valid_name(request[key]):
+                raise ServiceError(400, f"'{key}' must be a plain name without '/', '\\', '.' or '..'")
+                
+        pcb_template = catalog.find_pcb_template(request['pcb_template'])
+        if pcb_template is None:
+            raise ServiceError(400, f"Unknown PCB template: {request['pcb_template']}")
+            
+        output = request.get('output') or 'directory'
+        if output not in ('directory', 'archive', 'both'):
+            raise ServiceError(400, f"Unknown output: {output}")
+        if output == 'archive' and request.get('init_git'):
+            raise ServiceError(400, "'init_git' requires the project directory (output 'directory' or 'both')")
+            
+        license_key = request.get('license') or 'none'
+        license_info = next((info for info in LICENSES if info['key'] == license_key), None)
+        if license_info is None:
+            raise ServiceError(400, f"Unknown license: {license_key}")
+            
+        return {
+            'project_location': request['project_location'],
+            'project_name': request['project_name'],
+            'board_name': request['board_name'],
+            'designer': request['designer'],
+            'company': request.get('company') or '',
+            'revision': request.get('revision') or "1.0.0",
+            'description': request.get('description') or '',
+            'pcb_template': pcb_template,
+            'license': license_info,
+            'init_git': bool(request.get('init_git')),
+            'output': output,
+            'archive_path': request.get('archive_path'),
+            'template_version': catalog.template_version
+        }
+        
+    def submit(self, request):
+        """Validate a creation request and queue it, returns the job"""
+        check_request(request)
+        
+        catalog_name = request.get('template') or self.default_catalog
+        catalog = self.catalogs.get(catalog_name)
+        if catalog is None:
+            raise ServiceError(404, f"Unknown template: {catalog_name}")
+            
+        errors = get_errors(catalog.issues)
+        if errors:
+            raise ServiceError(409, f"Template {catalog_name} is invalid: "
+                                    + "; ".join(f"{path}: {message}" for _, path, message in errors))
+                                    
+        values = self.build_values(request, catalog)
+        project_path = (Path(values['project_location']) / values['project_name']).resolve()
+        archive_path = get_archive_path(values)
+        if archive_path:
+            if archive_path.name.lower().endswith('.tar.zst') and not zstd_available():
+                raise ServiceError(400, "Writing .tar.zst archives requires the 'zstandard' package")
+            archive_path = archive_path.resolve()
+            values['archive_path'] = str(archive_path)
+        
+        with self.lock:
+            if values['output'] != 'archive':
+                if project_path.exists() or project_path in self.active_paths:
+                    raise ServiceError(409, f"Directory already exists: {project_path}")
+            if archive_path and (archive_path.exists() or archive_path in self.active_paths):
+                raise ServiceError(409, f"Archive already exists: {archive_path}")
+            paths = [archive_path] if archive_path else []
+            if values['output'] != 'archive':
+                paths.append(project_path)
+            self.active_paths.update(paths)
+            
+            job = {
+                'id': uuid.uuid4().hex,
+                'status': 'queued',
+                'template': catalog_name,
+                'project_path': str(project_path) if values['output'] != 'archive' else None,
+                'archive_path': values['archive_path'],
+                'submitted': time.time()
+            }
+            self.jobs[job['id']] = job
+            self.prune_jobs()
+            
+            self.futures[job['id']] = self.executor.submit(
+                self.run_job, job, catalog, values, paths)
+            return dict(job)
+        
+    def run_job(self, job, catalog, values, paths):
+        """Create the project of a job"""
+        # Jobs are only changed under the lock, get_job copies them
+        with self.lock:
+            job['status'] = 'running'
+            job['started'] = time.time()
+        result = {'status': 'failed'}
+        try:
+            self.plugin.create_project(catalog.template_path, values, catalog.resolver,
+                                       catalog.template_files)
+            result = {'status': 'done'}
+        except Exception as e:
+            result['error'] = str(e)
+        finally:
+            with self.lock:
+                job.update(result)
+                job['finished'] = time.time()
+                self.active_paths.difference_update(paths)
+                self.futures.pop(job['id'], None)
+        return job
+        
+    def get_job(self, job_id):
+        """Return a copy of a job (None if unknown)"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job is not None else None
+        
+    def wait(self, job_id, timeout=None):
+        """Wait until a job is finished"""
+        future = self.futures.get(job_id)
+        if future is not None:
+            future.result(timeout)
+        return self.get_job(job_id)
+        
+    def prune_jobs(self):
+        """Drop the oldest finished jobs (lock must be held)"""
+        finished = [job for job in self.jobs.values() if 'finished' in job]
+        if len(finished) > MAX_FINISHED_JOBS:
+            finished.sort(key=lambda job: job['finished'])
+            for job in finished[:len(finished) - MAX_FINISHED_JOBS]:
+                del self.jobs[job['id']]
+
+
+class ServiceRequestHandler(http.server.BaseHTTPRequestHandler):
+    """JSON API of the project service"""
+    
+    def send_json(self, status, data):
+        """Send a JSON response"""
+        body = json.dumps(data, indent=2).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        
+    def do_GET(self):
+        """Handle status and catalog requests"""
+        service = self.server.service
+        
+        if self.path == '/health':
+            self.send_json(200, {'status': 'ok', 'templates': list(service.catalogs)})
+        elif self.path == '/templates':
+            self.send_json(200, [catalog.to_dict() for catalog in service.catalogs.values()])
+        elif self.path.startswith('/jobs/'):
+            job = service.get_job(self.path[len('/jobs/'):])
+            if job is None:
+                self.send_json(404, {'error': "Unknown job"})
+            else:
+                self.send_json(200, job)
+        else:
+            self.send_json(404, {'error': f"Unknown path: {self.path}"})
+            
+    def do_POST(self):
+        """Handle project creation requests"""
+        service = self.server.service
+        
+        if self.path != '/projects':
+            self.send_json(404, {'error': f"Unknown path: {self.path}"})
+            return
+            
+        try:
+            # Web pages can post to localhost without a CORS preflight unless the body is JSON
+            if not self.is_local_origin(self.headers.get('Origin')):
+                raise ServiceError(403, f"Origin not allowed: {self.headers.get('Origin')}")
+            if self.headers.get_content_type() != 'application/json':
+                raise ServiceError(415, "Content-Type must be application/json")
+                
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+                
+            job = service.submit(request)
+            if request.get('wait'):
+                job = service.wait(job['id'])
+                self.send_json(201 if job['status'] == 'done' else 500, job)
+            else:
+                self.send_json(202, job)
+                
+        except ValueError as e:
+            self.send_json(400, {'error': f"Invalid JSON: {e}"})
+        except ServiceError as e:
+            self.send_json(e.status, {'error': str(e)})
+        except Exception as e:
+            self.send_json(500, {'error': str(e)})
+            
+    def is_local_origin(self, origin):
+        """True if a request was not sent by a foreign web page (no Origin or a local one)"""
+        if origin is None:
+            return True
+        try:
+            url = urllib.parse.urlsplit(origin)
+            port = url.port or 80
+        except ValueError:
+            return False
+        host, server_port = self.server.server_address[:2]
+        return (url.scheme == 'http' and url.hostname in (*LOCAL_HOSTS, host)
+                and port == server_port)
+
+
+def main(argv=None):
+    """Start the project service"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="KiCad project creation service")
+    parser.add_argument('--template', action='append', metavar='NAME=PATH',
+                        help="Template root (can be given multiple times, the first is the default)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--poll-interval', type=float, default=5.0,
+                        help="Seconds between checks of the template roots for changes")
+    args = parser.parse_args(argv)
+    
+    templates = args.template or [f"default={Path(__file__).parent / '__Project__'}"]
+    catalogs = []
+    for template in templates:
+        name, _, path = template.partition('=')
+        if not path:
+            name, path = Path(name).name, name
+        catalog = TemplateCatalog(name, path)
+        for severity, issue_path, message in catalog.issues:
+            if severity == ERROR:
+                print(f"Template {name}: {issue_path}: {message}")
+        catalogs.append(catalog)
+        
+    service = ProjectService(catalogs, args.workers, args.poll_interval)
+    service.start()
+    
+    server = http.server.ThreadingHTTPServer((args.host, args.port), ServiceRequestHandler)
+    server.service = service
+    print(f"Project service listening on http://{args.host}:{args.port}")
+    
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+        
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,321 @@
+"""
+Project Writers
+
+Output targets of the project creation. Every file of a new project is
+produced exactly once and streamed into a writer: the project directory, a
+.zip or .tar(.gz/.xz/.zst) archive, or several of them at once. Archives are
+written with deterministic timestamps, permissions and ownership, so equal
+inputs (written in the same order) give byte-identical artifacts.
+
+The timestamp of archive entries is taken from SOURCE_DATE_EPOCH if set,
+otherwise 1980-01-01 (the earliest date a .zip file can store) is used.
+"""
+
+import os
+import io
+import time
+import gzip
+import lzma
+import shutil
+import tarfile
+import zipfile
+from pathlib import Path
+
+try:
+    from .placeholder_scan import (find_markers, forget_matches, check_matches,
+                                   rendered_size, stream_markers)
+except ImportError:
+    from placeholder_scan import (find_markers, forget_matches, check_matches,
+                                  rendered_size, stream_markers)
+
+
+# Chunk size used to stream files into the writers
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# 1980-01-01 00:00:00 UTC
+DEFAULT_ARCHIVE_EPOCH = 315532800
+
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.xz', '.tar.zst')
+
+
+def archive_epoch():
+    """Timestamp used for all archive entries"""
+    try:
+        return max(int(os.environ['SOURCE_DATE_EPOCH']), DEFAULT_ARCHIVE_EPOCH)
+    except (KeyError, ValueError):
+        return DEFAULT_ARCHIVE_EPOCH
+
+
+def zstd_available():
+    """Check if the optional zstandard package for .tar.zst archives is installed"""
+    try:
+        import zstandard
+    except ImportError:
+        return False
+    return True
+
+
+def normalize_mode(mode):
+    """Reduce file permissions to 0644 or 0755"""
+    return 0o755 if mode & 0o111 else 0o644
+
+
+class ProjectWriter:
+    """Base class of all writers, paths are relative POSIX paths"""
+    
+    def add_directory(self, relative_path):
+        """Add an (empty) directory"""
+        raise NotImplementedError
+        
+    def open_entry(self, relative_path, size, mode=0o644):
+        """Open a file entry of the given size, returns a writable stream"""
+        raise NotImplementedError
+        
+    def add_bytes(self, relative_path, data, mode=0o644):
+        """Add a file with the given content"""
+        with self.open_entry(relative_path, len(data), mode) as out:
+            out.write(data)
+            
+    def add_file(self, relative_path, source):
+        """Add a copy of a file"""
+        stat = os.stat(source)
+        with self.open_entry(relative_path, stat.st_size, normalize_mode(stat.st_mode)) as out:
+            with open(source, 'rb') as f:
+                shutil.copyfileobj(f, out, STREAM_CHUNK_SIZE)
+                
+    def add_rendered(self, relative_path, source, replacements, matches=None):
+        """Add a copy of a file with all markers (or the given matches) replaced"""
+        if matches is None:
+            matches = find_markers(source, replacements.keys())
+            if not check_matches(source, matches):
+                # Changed within the timestamp resolution, scan again
+                forget_matches(source)
+                matches = find_markers(source, replacements.keys())
+        size = rendered_size(source, matches, replacements)
+        mode = normalize_mode(os.stat(source).st_mode)
+        with self.open_entry(relative_path, size, mode) as out:
+            stream_markers(source, matches, replacements, out)
+            
+    def close(self):
+        """Finish the output"""
+        
+    def abort(self):
+        """Stop an incomplete output, the partial result is removed by the caller"""
+        self.close()
+        
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class DirectoryWriter(ProjectWriter):
+    """Writes the project into a directory"""
+    
+    def __init__(self, root):
+        self.root = Path(root)
+        self.root.mkdir(parents=True)
+        
+    def add_directory(self, relative_path):
+        (self.root / relative_path).mkdir(parents=True, exist_ok=True)
+        
+    def open_entry(self, relative_path, size, mode=0o644):
+        target = self.root / relative_path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        stream = open(target, 'wb')
+        if mode & 0o111:
+            os.chmod(target, os.stat(target).st_mode | 0o111)
+        return stream
+
+
+class EntryStream(io.RawIOBase):
+    """Writable stream of a single archive entry that checks the announced size"""
+    
+    def __init__(self, out, size, on_close=None):
+        super().__init__()
+        self.out = out
+        self.size = size
+        self.written = 0
+        self.on_close = on_close
+        
+    def writable(self):
+        return True
+        
+    def write(self, data):
+        self.out.write(data)
+        self.written += len(data)
+        return len(data)
+        
+    def close(self):
+        if not self.closed:
+            super().close()
+            if self.written != self.size:
+                raise IOError(f"Entry size mismatch: {self.written} of {self.size} bytes written")
+            if self.on_close:
+                self.on_close(self)
+
+
+class ZipWriter(ProjectWriter):
+    """Writes the project into a .zip archive"""
+    
+    def __init__(self, path, prefix=''):
+        self.prefix = f"{prefix}/" if prefix else ''
+        self.date_time = time.gmtime(archive_epoch())[:6]
+        self.zip = zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED)
+        
+    def make_info(self, name, mode):
+        """Create a deterministic ZipInfo"""
+        info = zipfile.ZipInfo(self.prefix + name, self.date_time)
+        info.create_system = 3
+        info.external_attr = mode << 16
+        return info
+        
+    def add_directory(self, relative_path):
+        info = self.make_info(relative_path.rstrip('/') + '/', 0o40755)
+        info.external_attr |= 0x10
+        self.zip.writestr(info, b'')
+        
+    def open_entry(self, relative_path, size, mode=0o644):
+        info = self.make_info(relative_path, 0o100000 | mode)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.file_size = size
+        stream = self.zip.open(info, 'w', force_zip64=size >= zipfile.ZIP64_LIMIT)
+        return EntryStream(stream, size, on_close=lambda entry: stream.close())
+        
+    def close(self):
+        self.zip.close()
+
+
+class TarWriter(ProjectWriter):
+    """Writes the project into a (compressed) tar archive"""
+    
+    def __init__(self, path, prefix='', compression=None):
+        self.prefix = f"{prefix}/" if prefix else ''
+        self.mtime = archive_epoch()
+        self.raw = open(path, 'wb')
+        self.written = 0
+        
+        if compression == 'gz':
+            self.stream = gzip.GzipFile(filename='', mode='wb', fileobj=self.raw, mtime=self.mtime)
+        elif compression == 'xz':
+            self.stream = lzma.LZMAFile(self.raw, 'wb')
+        elif compression == 'zst':
+            try:
+                import zstandard
+            except ImportError:
+                self.raw.close()
+                os.unlink(path)
+                raise RuntimeError("Writing .tar.zst archives requires the 'zstandard' package")
+            self.stream = zstandard.ZstdCompressor().stream_writer(self.raw, closefd=False)
+        else:
+            self.stream = None
+            
+    def write(self, data):
+        """Write to the (compressed) archive"""
+        (self.stream or self.raw).write(data)
+        self.written += len(data)
+        
+    def make_info(self, name, size, mode, entry_type):
+        """Create a deterministic TarInfo"""
+        info = tarfile.TarInfo(self.prefix + name)
+        info.size = size
+        info.mode = mode
+        info.mtime = self.mtime
+        info.type = entry_type
+        info.uid = info.gid = 0
+        info.uname = info.gname = ''
+        return info
+        
+    def add_directory(self, relative_path):
+        info = self.make_info(relative_path.rstrip('/'), 0, 0o755, tarfile.DIRTYPE)
+        self.write(info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape'))
+        
+    def open_entry(self, relative_path, size, mode=0o644):
+        info = self.make_info(relative_path, size, mode, tarfile.REGTYPE)
+        self.write(info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape'))
+        return EntryStream(self, size, on_close=self.pad_block)
+        
+    def pad_block(self, entry):
+        """Pad the data of an entry to a full block"""
+        remainder = entry.size % tarfile.BLOCKSIZE
+        if remainder:
+            self.write(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+            
+    def close(self):
+        # End of archive marker, padded to a full record
+        self.write(tarfile.NUL * (2 * tarfile.BLOCKSIZE))
+        remainder = self.written % tarfile.RECORDSIZE
+        if remainder:
+            self.write(tarfile.NUL * (tarfile.RECORDSIZE - remainder))
+            
+        if self.stream:
+            self.stream.close()
+        self.raw.close()
+
+
+class TeeWriter(ProjectWriter):
+    """Writes the project into several writers in one pass"""
+    
+    def __init__(self, writers):
+        self.writers = writers
+        
+    def add_directory(self, relative_path):
+        for writer in self.writers:
+            writer.add_directory(relative_path)
+            
+    def open_entry(self, relative_path, size, mode=0o644):
+        streams = [writer.open_entry(relative_path, size, mode) for writer in self.writers]
+        return TeeStream(streams)
+        
+    def close(self):
+        for writer in self.writers:
+            writer.close()
+
+    def abort(self):
+        for writer in self.writers:
+            writer.abort()
+
+
+class TeeStream(io.RawIOBase):
+    """Writable stream duplicating all data into several streams"""
+    
+    def __init__(self, streams):
+        super().__init__()
+        self.streams = streams
+        
+    def writable(self):
+        return True
+        
+    def write(self, data):
+        for stream in self.streams:
+            stream.write(data)
+        return len(data)
+        
+    def close(self):
+        if not self.closed:
+            super().close()
+            for stream in self.streams:
+                stream.close()
+
+
+def open_archive_writer(path, prefix=''):
+    """Open a writer for an archive, the format is chosen by the file name"""
+    name = Path(path).name.lower()
+    
+    if name.endswith('.zip'):
+        return ZipWriter(path, prefix)
+    if name.endswith('.tar'):
+        return TarWriter(path, prefix)
+    if name.endswith(('.tar.gz', '.tgz')):
+        return TarWriter(path, prefix, 'gz')
+    if name.endswith('.tar.xz'):
+        return TarWriter(path, prefix, 'xz')
+    if name.endswith('.tar.zst'):
+        return TarWriter(path, prefix, 'zst')
+        
+    raise ValueError(f"Unsupported archive format: {path} "
+                     f"(supported: {', '.join(ARCHIVE_SUFFIXES)})")
@@ -0,0 +1,350 @@
+"""
+Template Deduplication
+
+Every project gets its own copy of the template directories (firmware,
+3d-print, cad, .github, ...), so shares with many projects hold lots of
+identical files. This tool walks project roots, hashes all files that may
+have a duplicate (in parallel, with a persistent hash cache keyed by device,
+inode, size and mtime, so unchanged files are never read again) and reports
+the duplicate bytes, in particular those attributable to template content.
+
+Unmodified template-derived files can optionally be replaced by hard links
+or reflinks (copy-on-write clones) to a single copy:
+- reflink: safe, every file stays independent (Linux with Btrfs, XFS, ...,
+  macOS with APFS); the default where supported
+- hardlink: works everywhere, but all linked files share their content and
+  metadata; an editor writing in place changes every linked project. It is
+  never chosen implicitly, so on Windows --mode hardlink must be given
+
+Usage (outside of KiCad):
+    python template_dedup.py report D:\\Projects E:\\Archive
+    python template_dedup.py reclaim D:\\Projects --mode reflink [--dry-run]
+"""
+
+import os
+import stat
+import errno
+import shutil
+import sqlite3
+import hashlib
+import concurrent.futures
+from pathlib import Path
+
+try:
+    from .project_index import get_data_dir, MANIFEST_DIR
+    from .project_journal import reflink_file, reflink_supported
+except ImportError:
+    from project_index import get_data_dir, MANIFEST_DIR
+    from project_journal import reflink_file, reflink_supported
+
+
+# Directories never scanned (repository data and plugin state)
+SKIPPED_DIRS = {'.git', MANIFEST_DIR}
+
+# Chunk size used for hashing
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Files smaller than a file system block do not free any space
+DEFAULT_MIN_SIZE = 4096
+
+RECLAIM_MODES = ('hardlink', 'reflink')
+
+# Errors of file systems that can not clone files
+REFLINK_UNSUPPORTED_ERRORS = {errno.EOPNOTSUPP, errno.ENOTSUP, errno.EINVAL, errno.ENOTTY}
+
+
+def format_size(size):
+    """Format a byte count for humans"""
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if size < 1024 or unit == 'GiB':
+            return f"{size:.1f} {unit}" if unit != 'B' else f"{size} B"
+        size /= 1024
+
+
+def hash_file(path):
+    """Return the SHA-256 of a file (hashlib releases the GIL, threads run in parallel)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def walk_files(roots, min_size=1):
+    """Yield (path, stat) of all regular files below the roots"""
+    for root in roots:
+        for directory, dir_names, file_names in os.walk(root):
+            dir_names[:] = sorted(name for name in dir_names if name not in SKIPPED_DIRS)
+            for name in sorted(file_names):
+                path = os.path.join(directory, name)
+                try:
+                    file_stat = os.lstat(path)
+                except OSError:
+                    continue
+                if stat.S_ISREG(file_stat.st_mode) and file_stat.st_size >= min_size:
+                    yield path, file_stat
+
+
+class HashCache:
+    """Persistent SHA-256 cache keyed by (device, inode), valid while size and mtime match"""
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS hashes (
+            dev INTEGER NOT NULL,
+            inode INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            sha256 TEXT NOT NULL,
+            PRIMARY KEY (dev, inode)
+        );
+    """
+    
+    def __init__(self, db_path=None):
+        self.db_path = Path(db_path) if db_path else get_data_dir() / "hashes.sqlite"
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        self.conn = sqlite3.connect(str(self.db_path))
+        self.conn.executescript(self.SCHEMA)
+        
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        
+    def close(self):
+        """Close the database connection"""
+        self.conn.close()
+        
+    def get(self, file_stat):
+        """Return the cached hash of a file or None if unknown or changed"""
+        row = self.conn.execute(
+            "SELECT sha256 FROM hashes WHERE dev = ? AND inode = ? AND size = ? AND mtime_ns = ?",
+            (file_stat.st_dev, file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns)
+        ).fetchone()
+        return row[0] if row else None
+        
+    def put_many(self, items):
+        """Store (stat, sha256) pairs"""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)",
+                [(file_stat.st_dev, file_stat.st_ino, file_stat.st_size,
+                  file_stat.st_mtime_ns, sha256) for file_stat, sha256 in items])
+                  
+    def hash_files(self, files, workers=None):
+        """Return path -> sha256 for (path, stat) pairs, only uncached inodes are read"""
+        hashes = {}
+        pending = {}
+        for path, file_stat in files:
+            cached = self.get(file_stat)
+            if cached:
+                hashes[path] = cached
+            else:
+                # Hard linked files are read once
+                pending.setdefault((file_stat.st_dev, file_stat.st_ino), []).append((path, file_stat))
+                
+        workers = workers or min(32, (os.cpu_count() or 1) * 2)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(hash_file, links[0][0]): links for links in pending.values()}
+            computed = []
+            for future in concurrent.futures.as_completed(futures):
+                links = futures[future]
+                try:
+                    sha256 = future.result()
+                except OSError as e:
+                    print(f"Error reading {links[0][0]}: {e}")
+                    continue
+                computed.append((links[0][1], sha256))
+                for path, _ in links:
+                    hashes[path] = sha256
+                    
+        self.put_many(computed)
+        return hashes
+
+
+class DedupScan:
+    """Duplicate files of project roots, attributed to the template"""
+    
+    def __init__(self, roots, cache, template_path=None, min_size=DEFAULT_MIN_SIZE, workers=None):
+        self.files = dict(walk_files(roots, min_size))
+        
+        # Only files sharing their size with another file can be duplicates
+        sizes = {}
+        for file_stat in self.files.values():
+            sizes[file_stat.st_size] = sizes.get(file_stat.st_size, 0) + 1
+        candidates = [(path, file_stat) for path, file_stat in self.files.items()
+                      if sizes[file_stat.st_size] > 1]
+                      
+        template_files = walk_files([template_path], min_size) if template_path else []
+        template_candidates = [(path, file_stat) for path, file_stat in template_files
+                               if sizes.get(file_stat.st_size, 0) > 1]
+                               
+        hashes = cache.hash_files(candidates + template_candidates, workers)
+        self.template_hashes = {hashes[path] for path, _ in template_candidates if path in hashes}
+        
+        # sha256 -> paths of the project files
+        self.groups = {}
+        for path, _ in candidates:
+            if path in hashes:
+                self.groups.setdefault(hashes[path], []).append(path)
+                
+    def inodes(self, paths):
+        """Distinct (device, inode) of the paths"""
+        return {(self.files[path].st_dev, self.files[path].st_ino) for path in paths}
+        
+    def duplicate_groups(self):
+        """Return (sha256, size, paths, reclaimable bytes, template) of all duplicate groups"""
+        result = []
+        for sha256, paths in self.groups.items():
+            inodes = self.inodes(paths)
+            devices = {dev for dev, _ in inodes}
+            if len(inodes) <= len(devices):
+                continue
+            size = self.files[paths[0]].st_size
+            reclaimable = size * (len(inodes) - len(devices))
+            result.append((sha256, size, sorted(paths), reclaimable, sha256 in self.template_hashes))
+        return sorted(result, key=lambda group: group[3], reverse=True)
+        
+    def template_derived_files(self):
+        """Yield (sha256, paths) of file groups with template content"""
+        for sha256, paths in sorted(self.groups.items()):
+            if sha256 in self.template_hashes:
+                yield sha256, sorted(paths)
+
+
+def replace_with_link(canonical, target, target_stat, mode):
+    """Replace target by a hard link or reflink of canonical, returns the new stat"""
+    current = os.lstat(target)
+    if (current.st_ino, current.st_size, current.st_mtime_ns) != (
+            target_stat.st_ino, target_stat.st_size, target_stat.st_mtime_ns):
+        raise OSError(f"{target} was modified during the scan")
+        
+    tmp_file = os.path.join(os.path.dirname(target), f".{os.path.basename(target)}.dedup")
+    try:
+        if mode == 'hardlink':
+            os.link(canonical, tmp_file)
+        else:
+            reflink_file(canonical, tmp_file)
+            shutil.copystat(target, tmp_file)
+        os.replace(tmp_file, target)
+    except BaseException:
+        if os.path.lexists(tmp_file):
+            os.unlink(tmp_file)
+        raise
+        
+    return os.lstat(target)
+
+
+def reclaim(scan, mode, cache, dry_run=False):
+    """Link the unmodified template-derived files of a scan, returns (files, bytes)"""
+    linked_files = 0
+    linked_bytes = 0
+    
+    unsupported_devices = set()
+    
+    for sha256, paths in scan.template_derived_files():
+        by_device = {}
+        for path in paths:
+            by_device.setdefault(scan.files[path].st_dev, []).append(path)
+            
+        for device, device_paths in by_device.items():
+            if device in unsupported_devices:
+                continue
+                
+            # Link to the copy with the most links, so repeated runs converge
+            canonical = min(device_paths, key=lambda path: (-scan.files[path].st_nlink, path))
+            canonical_ino = scan.files[canonical].st_ino
+            
+            new_stats = []
+            for path in device_paths:
+                file_stat = scan.files[path]
+                if file_stat.st_ino == canonical_ino:
+                    continue
+                if dry_run:
+                    print(f"Would link {path} -> {canonical}")
+                else:
+                    try:
+                        new_stats.append((replace_with_link(canonical, path, file_stat, mode), sha256))
+                    except OSError as e:
+                        if mode == 'reflink' and e.errno in REFLINK_UNSUPPORTED_ERRORS:
+                            # Reported once, all files on this file system would fail the same way
+                            print(f"Skipped the file system of {path}: reflinks are not supported ({e})")
+                            unsupported_devices.add(device)
+                            break
+                        print(f"Skipped {path}: {e}")
+                        continue
+                linked_files += 1
+                linked_bytes += file_stat.st_size
+                
+            cache.put_many(new_stats)
+            
+    return linked_files, linked_bytes
+
+
+def main(argv=None):
+    """Command line interface for the template deduplication"""
+    import argparse
+    
+    default_template = Path(__file__).parent / "__Project__"
+    
+    parser = argparse.ArgumentParser(description="Find and reclaim duplicate template files of KiCad projects")
+    parser.add_argument('--db', help="Path of the hash cache database")
+    parser.add_argument('--template', default=str(default_template),
+                        help="Template root the duplicates are attributed to")
+    parser.add_argument('--min-size', type=int, default=DEFAULT_MIN_SIZE,
+                        help="Ignore files smaller than this (bytes)")
+    parser.add_argument('--workers', type=int, help="Number of hashing threads")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    report_parser = subparsers.add_parser('report', help="Report duplicate bytes below the given roots")
+    report_parser.add_argument('roots', nargs='+')
+    report_parser.add_argument('--top', type=int, default=10, help="Number of largest groups shown")
+    
+    reclaim_parser = subparsers.add_parser('reclaim', help="Link unmodified template-derived files")
+    reclaim_parser.add_argument('roots', nargs='+')
+    # Hard links are never the default, linked files share their content
+    reclaim_parser.add_argument('--mode', choices=RECLAIM_MODES,
+                                default='reflink' if reflink_supported() else None,
+                                help="reflink (default where supported) or hardlink")
+    reclaim_parser.add_argument('--dry-run', action='store_true')
+    
+    args = parser.parse_args(argv)
+    
+    template_path = args.template if Path(args.template).is_dir() else None
+    if template_path is None:
+        print(f"Template not found: {args.template} (duplicates are not attributed)")
+        
+    with HashCache(args.db) as cache:
+        scan = DedupScan(args.roots, cache, template_path, args.min_size, args.workers)
+        groups = scan.duplicate_groups()
+        
+        if args.command == 'report':
+            total = sum(file_stat.st_size for file_stat in scan.files.values())
+            reclaimable = sum(group[3] for group in groups)
+            template_bytes = sum(group[3] for group in groups if group[4])
+            
+            print(f"Scanned {len(scan.files)} file(s), {format_size(total)}")
+            print(f"Duplicates: {len(groups)} group(s), {format_size(reclaimable)} reclaimable")
+            print(f"Template-derived: {sum(1 for group in groups if group[4])} group(s), "
+                  f"{format_size(template_bytes)} reclaimable")
+            for sha256, size, paths, group_bytes, template in groups[:args.top]:
+                origin = "template" if template else "other"
+                print(f"  {format_size(group_bytes)} in {len(paths)} copies of {format_size(size)} "
+                      f"({origin}): {paths[0]}")
+        elif args.command == 'reclaim':
+            if template_path is None:
+                return 1
+            if args.mode is None:
+                print("Reflinks are not supported on this platform, use --mode hardlink "
+                      "(hard linked files share their content)")
+                return 1
+            linked_files, linked_bytes = reclaim(scan, args.mode, cache, args.dry_run)
+            action = "Would link" if args.dry_run else "Linked"
+            print(f"{action} {linked_files} file(s), {format_size(linked_bytes)} ({args.mode})")
+            
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
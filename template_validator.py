@@ -0,0 +1,317 @@
+"""
+Template Validator
+
+Checks the project template before it is instantiated: JSON files must parse,
+S-expression files must be balanced, the placeholders replaced during project
+creation must be present and all Template.* counterparts must exist.
+
+Files are checked concurrently and the results are cached by content hash,
+so only changed template files are checked again.
+
+Usage (outside of KiCad):
+    python template_validator.py [path/to/__Project__]
+"""
+
+import os
+import re
+import json
+import hashlib
+import concurrent.futures
+from pathlib import Path
+
+try:
+    from .project_index import get_data_dir
+except ImportError:
+    from project_index import get_data_dir
+
+
+# Bump when the checks change to invalidate cached results
+VALIDATOR_VERSION = 1
+
+ERROR = "error"
+WARNING = "warning"
+
+# Pattern: Template - manufacturer_thickness_x-layer.kicad_pcb
+PCB_TEMPLATE_PATTERN = re.compile(r'^Template - ([^_]+)_([^_]+)_(\d+)-layer\.kicad_pcb$')
+
+# Files that have to exist in the hardware directory of the template
+REQUIRED_HARDWARE_FILES = ["Template.kicad_pro", "Template.kicad_sch",
+                           "kibot_yaml/kibot_main.yaml"]
+
+JSON_SUFFIXES = {'.kicad_pro', '.kicad_prl', '.json'}
+SEXPR_SUFFIXES = {'.kicad_sch', '.kicad_pcb', '.kicad_sym', '.kicad_wks', '.kicad_mod'}
+SEXPR_NAMES = {'sym-lib-table', 'fp-lib-table'}
+
+SCHEMATIC_PLACEHOLDERS = [b'(title "Template")']
+PCB_PLACEHOLDERS = [b'BOARD_NAME" "Template"', b'PROJECT_NAME" "Template"']
+
+SEXPR_STRING_PATTERN = re.compile(rb'"(?:[^"\\]|\\.)*"', re.DOTALL)
+
+# Cache of the current worker: "version:kind:digest" -> issues
+_worker_cache = {}
+
+
+def _init_worker(cache):
+    """Initialize the result cache of a worker"""
+    global _worker_cache
+    _worker_cache = cache
+
+
+def check_json(data):
+    """Check that the data is valid JSON"""
+    try:
+        json.loads(data.decode('utf-8'))
+    except (UnicodeDecodeError, ValueError) as e:
+        return [(ERROR, f"invalid JSON: {e}")]
+    return []
+
+
+def check_sexpr(data):
+    """Check that the parentheses of an S-expression file are balanced"""
+    # Strings may contain parentheses, drop them before counting
+    stripped = SEXPR_STRING_PATTERN.sub(b'', data)
+    
+    if b'"' in stripped:
+        return [(ERROR, "unterminated string")]
+        
+    opened = stripped.count(b'(')
+    closed = stripped.count(b')')
+    if opened != closed:
+        return [(ERROR, f"unbalanced S-expression ({opened} '(' vs {closed} ')')")]
+    if not stripped.lstrip().startswith(b'('):
+        return [(ERROR, "not an S-expression")]
+    return []
+
+
+def check_placeholders(data, placeholders):
+    """Check that all placeholders replaced during project creation are present"""
+    return [(WARNING, f"placeholder {placeholder.decode('utf-8')} not found")
+            for placeholder in placeholders if placeholder not in data]
+
+
+def check_kibot(data):
+    """Check the main KiBot configuration"""
+    try:
+        content = data.decode('utf-8')
+    except UnicodeDecodeError as e:
+        return [(ERROR, f"not UTF-8 encoded: {e}")]
+        
+    if 'definitions:' not in content:
+        return [(WARNING, "no definitions found, project metadata will not be applied")]
+    return []
+
+
+def run_checks(kind, data):
+    """Run all checks of the given file kind"""
+    if kind == 'json':
+        return check_json(data)
+    if kind == 'sexpr':
+        return check_sexpr(data)
+    if kind == 'schematic':
+        return check_sexpr(data) + check_placeholders(data, SCHEMATIC_PLACEHOLDERS)
+    if kind == 'pcb':
+        return check_sexpr(data) + check_placeholders(data, PCB_PLACEHOLDERS)
+    if kind == 'kibot':
+        return check_kibot(data)
+    return []
+
+
+def validate_file(file_path, kind):
+    """Validate a single file, returns (cache key, issues, cache hit)"""
+    with open(file_path, 'rb') as f:
+        data = f.read()
+        
+    key = f"{VALIDATOR_VERSION}:{kind}:{hashlib.sha256(data).hexdigest()}"
+    if key in _worker_cache:
+        return key, _worker_cache[key], True
+        
+    return key, [list(issue) for issue in run_checks(kind, data)], False
+
+
+def get_file_kind(relative_path):
+    """Return the kind of checks for a template file (None if not checked)"""
+    name = relative_path.name
+    parts = relative_path.parts
+    
+    if parts[0] == "hardware" and len(parts) == 2:
+        if name == "Template.kicad_sch":
+            return 'schematic'
+        if name.startswith("Template - ") and name.endswith(".kicad_pcb"):
+            return 'pcb'
+    if parts[-2:] == ("kibot_yaml", "kibot_main.yaml"):
+        return 'kibot'
+    if relative_path.suffix in JSON_SUFFIXES:
+        return 'json'
+    if relative_path.suffix in SEXPR_SUFFIXES or name in SEXPR_NAMES:
+        return 'sexpr'
+    return None
+
+
+def check_structure(template_path):
+    """Check that all files needed for project creation exist"""
+    issues = []
+    hardware_path = template_path / "hardware"
+    
+    if not hardware_path.is_dir():
+        return [(ERROR, "hardware", "hardware directory not found")]
+        
+    for name in REQUIRED_HARDWARE_FILES:
+        if not (hardware_path / name).is_file():
+            issues.append((ERROR, f"hardware/{name}", "required file is missing"))
+            
+    variants = list(hardware_path.glob("Template - *.kicad_pcb"))
+    for variant in variants:
+        if not PCB_TEMPLATE_PATTERN.match(variant.name):
+            issues.append((ERROR, f"hardware/{variant.name}",
+                           "PCB template name does not match "
+                           "'Template - manufacturer_thickness_x-layer.kicad_pcb'"))
+    if not variants:
+        issues.append((ERROR, "hardware", "no PCB templates (Template - *.kicad_pcb) found"))
+        
+    return issues
+
+
+def load_cache(cache_file):
+    """Load cached validation results: template path -> {relative path: [key, issues]}"""
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+        
+    # Caches of older versions are a flat key -> issues mapping
+    templates = cache.get('templates') if isinstance(cache, dict) else None
+    return templates if isinstance(templates, dict) else {}
+
+
+def save_cache(cache_file, cache):
+    """Save validation results"""
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = cache_file.with_suffix('.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({'templates': cache}, f)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        print(f"Error saving validation cache: {e}")
+
+
+def validate_files(template_path, relative_paths=None, use_processes=False, cache_file=None):
+    """
+    Validate the files of a template (all if relative_paths is None).
+
+    Returns a dict relative POSIX path -> list of (severity, message) of all
+    checked files, including those without issues.
+    """
+    template_path = Path(template_path)
+    cache_file = Path(cache_file) if cache_file else get_data_dir() / "template_validation.json"
+    complete = relative_paths is None
+    
+    if complete:
+        relative_paths = []
+        for directory, dirnames, filenames in os.walk(template_path):
+            dirnames[:] = [d for d in dirnames if d != '.git']
+            for filename in filenames:
+                relative_paths.append((Path(directory) / filename).relative_to(template_path))
+    
+    files = []
+    for relative_path in relative_paths:
+        relative_path = Path(relative_path)
+        kind = get_file_kind(relative_path)
+        if kind and (template_path / relative_path).is_file():
+            files.append((template_path / relative_path, relative_path, kind))
+                
+    cache = load_cache(cache_file)
+    template_key = str(template_path.resolve())
+    previous = cache.get(template_key, {})
+    known = {key: issues for key, issues in previous.values()}
+    entries = {}
+    file_issues = {}
+    
+    executor_class = (concurrent.futures.ProcessPoolExecutor if use_processes
+                      else concurrent.futures.ThreadPoolExecutor)
+    with executor_class(max_workers=os.cpu_count() or 1,
+                        initializer=_init_worker, initargs=(known,)) as executor:
+        futures = {
+            executor.submit(validate_file, str(file_path), kind): relative_path
+            for file_path, relative_path, kind in files
+        }
+        for future in concurrent.futures.as_completed(futures):
+            relative_path = futures[future].as_posix()
+            try:
+                key, issues, _ = future.result()
+            except OSError as e:
+                file_issues[relative_path] = [(ERROR, f"cannot be read: {e}")]
+                continue
+                
+            entries[relative_path] = [key, issues]
+            file_issues[relative_path] = [tuple(issue) for issue in issues]
+                
+    # The cache of a template only holds the results of the last run, a
+    # partial run keeps those of the other files that still exist
+    if not complete:
+        checked = {Path(relative_path).as_posix() for relative_path in relative_paths}
+        for relative_path, entry in previous.items():
+            if relative_path not in checked and (template_path / relative_path).is_file():
+                entries.setdefault(relative_path, entry)
+                
+    # Templates that were removed are dropped
+    updated = {path: section for path, section in cache.items()
+               if path != template_key and Path(path).is_dir()}
+    updated[template_key] = entries
+    if updated != cache:
+        save_cache(cache_file, updated)
+        
+    return file_issues
+
+
+def merge_issues(structure_issues, file_issues):
+    """Combine the structure issues and the issues of validate_files, errors first"""
+    issues = list(structure_issues)
+    for relative_path, issues_of_file in file_issues.items():
+        issues.extend((severity, relative_path, message) for severity, message in issues_of_file)
+    return sorted(issues, key=lambda issue: (issue[0] != ERROR, issue[1]))
+
+
+def validate_template(template_path, use_processes=False, cache_file=None):
+    """
+    Validate a project template, returns a list of (severity, path, message).
+
+    Processes must not be used inside KiCad, where the interpreter is embedded
+    and sys.executable is not a Python executable.
+    """
+    template_path = Path(template_path)
+    file_issues = validate_files(template_path, None, use_processes, cache_file)
+    return merge_issues(check_structure(template_path), file_issues)
+
+
+def get_errors(issues):
+    """Return only the errors of a validation result"""
+    return [issue for issue in issues if issue[0] == ERROR]
+
+
+def format_issues(issues):
+    """Format validation issues for display"""
+    return "\n".join(f"[{severity}] {path}: {message}" for severity, path, message in issues)
+
+
+def main(argv=None):
+    """Command line interface for the template validator"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Validate a KiCad project template")
+    parser.add_argument('template', nargs='?',
+                        default=str(Path(__file__).parent / "__Project__"))
+    args = parser.parse_args(argv)
+    
+    issues = validate_template(args.template, use_processes=True)
+    if issues:
+        print(format_issues(issues))
+        
+    errors = get_errors(issues)
+    print(f"{len(errors)} error(s), {len(issues) - len(errors)} warning(s)")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())